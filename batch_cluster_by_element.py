@@ -1,9 +1,10 @@
 import pickle
-import networkx as nx
 import time
-from collections import Counter
 import matplotlib.pyplot as plt
 import math
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
+from composition_fingerprints import cluster_by_composition
 
 
 # Node match function for isomorphism
@@ -16,49 +17,15 @@ def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
 
-# Function to calculate element counts
-def calculate_element_count(graph):
-    element_counts = Counter(n['element'] for _, n in graph.nodes(data=True))
-    sorted_elements = sorted(element_counts.items())
-    element_string = "".join(f"{el}{count}" for el, count in sorted_elements)
-    return element_string
-
-
-# Function to cluster by element counts
+# Function to cluster by element counts (vectorized element count vectors instead of "C3H2O1" strings)
 def cluster_by_element_counts(data):
-    clusters = {}
-    for i, rc in enumerate(data):
-        element_string = calculate_element_count(rc['reaction_center'])
-        if element_string not in clusters:
-            clusters[element_string] = []
-        clusters[element_string].append(i)
-    return list(clusters.values())
-
-
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data, element_clusters):
-    final_clusters = []
-    for group in element_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
+    return cluster_by_composition(data, ('elements',))
 
 
 # Function to process a batch
-def process_batch(batch_data):
+def process_batch(batch_data, verdict_cache, call_log):
     element_clusters = cluster_by_element_counts(batch_data)
-    final_clusters = postcluster_by_isomorphism(batch_data, element_clusters)
+    final_clusters = postcluster_by_isomorphism(batch_data, element_clusters, verdict_cache, call_log, node_match, edge_match)
     return final_clusters
 
 
@@ -69,7 +36,7 @@ def split_data_into_chunks(data, n):
 
 
 # Main function to process the dataset in chunks
-def main_in_batches(data, n_batches):
+def main_in_batches(data, n_batches, verdict_cache, call_log):
     # Split data into n_batches
     chunks = split_data_into_chunks(data, n_batches)
     all_batch_results = []
@@ -80,7 +47,7 @@ def main_in_batches(data, n_batches):
         start_time = time.time()
 
         # Process the current chunk
-        batch_result = process_batch(chunk)
+        batch_result = process_batch(chunk, verdict_cache, call_log)
         all_batch_results.append(batch_result)
 
         end_time = time.time()
@@ -96,9 +63,13 @@ def main_in_batches(data, n_batches):
 with open('Larger_rcs.pkl', 'rb') as f:
     data = pickle.load(f)
 
-# Run clustering in batches
+# Run clustering in batches, reusing isomorphism verdicts computed by earlier runs
+verdict_cache = load_verdict_cache()
+call_log = new_call_log()
 n_batches = 20  # Adjust the number of batches as needed
-results = main_in_batches(data, n_batches)
+results = main_in_batches(data, n_batches, verdict_cache, call_log)
+save_verdict_cache(verdict_cache)
+report_call_log(call_log)
 batch_results = results [0]
 all_times = results[1]
 
@@ -1,49 +1,66 @@
-import networkx as nx
 import pickle
 from collections import Counter, defaultdict
 import time
 import math
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
+
+
+# Function to collect the neighbor positions and edge order codes of every node (the graph is not modified)
+def build_neighborhoods(graph, edge_order_table):
+    node_index = {node: i for i, node in enumerate(graph.nodes())}
+    neighborhoods = []
+    for node, neighbors in graph.adjacency():
+        neighborhood = []
+        for neighbor, edge_attrs in neighbors.items():
+            order = edge_attrs['order']
+            if order not in edge_order_table:
+                edge_order_table[order] = len(edge_order_table)
+            neighborhood.append((node_index[neighbor], edge_order_table[order]))
+        neighborhoods.append(neighborhood)
+    return neighborhoods
 
 
 # Function to initialize node labels WITH edge labels
-def initialize_labels(graph):
-    for node, attrs in graph.nodes(data=True):
-        base_label = f"{attrs['element']}_{attrs['charge']}"
-        neighbor_edge_orders = sorted([str(graph[node][neighbor]['order']) for neighbor in graph.neighbors(node)])
-        attrs['label'] = f"{base_label},{','.join(neighbor_edge_orders)}"
+def initialize_labels(graph, neighborhoods, initial_hash_table):
+    labels = []
+    for (node, attrs), neighborhood in zip(graph.nodes(data=True), neighborhoods):
+        initial_label = (attrs['element'], attrs['charge']) + tuple(sorted(order for _, order in neighborhood))
+        if initial_label not in initial_hash_table:
+            initial_hash_table[initial_label] = len(initial_hash_table)
+        labels.append(initial_hash_table[initial_label])
+    return labels
 
 
 # Function to perform a single Weisfeiler-Lehman iteration using a shared hash table
-def wl_iteration_with_shared_hash(graph, shared_hash_table):
-    new_labels = {}
-    for node, attrs in graph.nodes(data=True):
-        current_label = attrs['label']
-        neighbor_labels = sorted([
-            f"{graph.nodes[neighbor]['label']}_{graph[node][neighbor]['order']}"
-            for neighbor in graph.neighbors(node)
-        ])
-        aggregated_label = f"{current_label},{','.join(neighbor_labels)}"
+def wl_iteration_with_shared_hash(labels, neighborhoods, shared_hash_table):
+    new_labels = []
+    for current_label, neighborhood in zip(labels, neighborhoods):
+        neighbor_labels = sorted([(labels[neighbor], order) for neighbor, order in neighborhood])
+        aggregated_label = (current_label,) + tuple(neighbor_labels)
         if aggregated_label not in shared_hash_table:
             shared_hash_table[aggregated_label] = len(shared_hash_table)
-        new_labels[node] = shared_hash_table[aggregated_label]
-    for node, new_label in new_labels.items():
-        graph.nodes[node]['label'] = str(new_label)
+        new_labels.append(shared_hash_table[aggregated_label])
+    return new_labels
 
 
 # Function to generate histogram of labels
-def generate_histogram(graph):
-    labels = [attrs['label'] for _, attrs in graph.nodes(data=True)]
+def generate_histogram(labels):
     histogram = Counter(labels)
     return histogram
 
 
 # Function to perform WL clustering
-def wl_clustering(graphs, shared_hash_table):
+def wl_clustering(graph_indices, graph_labels, graph_neighborhoods, shared_hash_table, num_labels, frozen_graphs):
     graph_histograms = {}
-    for graph_idx, graph in graphs.items():
-        wl_iteration_with_shared_hash(graph, shared_hash_table)
-        histogram = generate_histogram(graph)
+    for graph_idx in graph_indices:
+        graph_labels[graph_idx] = wl_iteration_with_shared_hash(graph_labels[graph_idx], graph_neighborhoods[graph_idx],
+                                                                shared_hash_table)
+        histogram = generate_histogram(graph_labels[graph_idx])
         graph_histograms[graph_idx] = histogram
+        if len(histogram) == num_labels[graph_idx]:
+            frozen_graphs.add(graph_idx)
+        num_labels[graph_idx] = len(histogram)
     clusters = defaultdict(list)
     for graph_idx, histogram in graph_histograms.items():
         histogram_tuple = tuple(sorted(histogram.items()))
@@ -51,53 +68,61 @@ def wl_clustering(graphs, shared_hash_table):
     return clusters
 
 
+# Function to split clusters into the worklist (clusters that may still split) and the final clusters
+def schedule_clusters(clusters, worklist, final_clusters, frozen_graphs):
+    for cluster_graphs in clusters:
+        # Singletons and clusters of frozen graphs can never split, retire them permanently
+        # (graphs of one cluster always share their frozen state, so checking the first one is enough)
+        if len(cluster_graphs) == 1 or cluster_graphs[0] in frozen_graphs:
+            final_clusters.append(cluster_graphs)
+        else:
+            worklist.append(cluster_graphs)
+
+
 # Function to perform recursive WL clustering
 def recursive_wl_clustering(data):
     shared_hash_table = {}
-    clusters = defaultdict(list)
-    graphs = {i: item['reaction_center'] for i, item in enumerate(data)}
-    for graph_idx, graph in graphs.items():
-        initialize_labels(graph)
-    clusters = wl_clustering(graphs, shared_hash_table)
+    initial_hash_table = {}
+    edge_order_table = {}
+    graph_neighborhoods = {}
+    graph_labels = {}
+    num_labels = {}
+    frozen_graphs = set()
+    for graph_idx, item in enumerate(data):
+        graph = item['reaction_center']
+        graph_neighborhoods[graph_idx] = build_neighborhoods(graph, edge_order_table)
+        graph_labels[graph_idx] = initialize_labels(graph, graph_neighborhoods[graph_idx], initial_hash_table)
+        num_labels[graph_idx] = len(generate_histogram(graph_labels[graph_idx]))
+    clusters = wl_clustering(range(len(data)), graph_labels, graph_neighborhoods, shared_hash_table,
+                             num_labels, frozen_graphs)
     num_clusters = len(clusters)
     iteration = 1
     print(f"Iteration {iteration}: Number of clusters = {num_clusters}")
-    while True:
-        new_clusters = defaultdict(list)
+    final_clusters = []
+    worklist = []
+    schedule_clusters(clusters.values(), worklist, final_clusters, frozen_graphs)
+    while worklist:
+        new_worklist = []
         shared_hash_table = {}
-        for cluster_graphs in clusters.values():
-            cluster_subgraphs = {idx: graphs[idx] for idx in cluster_graphs}
-            sub_clusters = wl_clustering(cluster_subgraphs, shared_hash_table)
-            for sub_cluster_key, sub_cluster_graphs in sub_clusters.items():
-                new_clusters[sub_cluster_key].extend(sub_cluster_graphs)
+        for cluster_graphs in worklist:
+            sub_clusters = wl_clustering(cluster_graphs, graph_labels, graph_neighborhoods, shared_hash_table,
+                                         num_labels, frozen_graphs)
+            # A cluster that did not split stays on the worklist until its graphs are frozen
+            schedule_clusters(sub_clusters.values(), new_worklist, final_clusters, frozen_graphs)
         iteration += 1
-        num_new_clusters = len(new_clusters)
-        print(f"Iteration {iteration}: Number of clusters = {num_new_clusters}")
-        if num_new_clusters == num_clusters:
-            break
-        num_clusters = num_new_clusters
-        clusters = new_clusters
-    return list(clusters.values())
+        worklist = new_worklist
+        print(f"Iteration {iteration}: Number of clusters = {len(final_clusters) + len(worklist)}, "
+              f"frozen graphs = {len(frozen_graphs)}")
+    return final_clusters
 
 
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data, invariant_clusters):
-    final_clusters = []
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=lambda n1, n2: n1['charge'] == n2['charge'] and n1['element'] == n2['element'], edge_match=lambda e1, e2: e1['order'] == e2['order']):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
+# Node match function
+def node_match(n1, n2):
+    return n1['charge'] == n2['charge'] and n1['element'] == n2['element']
+
+# Edge match function
+def edge_match(e1, e2):
+    return e1['order'] == e2['order']
 
 
 # Function to split data into chunks
@@ -107,7 +132,7 @@ def split_data_into_chunks(data, n_batches):
 
 
 # Main function to process in batches
-def main_in_batches(data, n_batches):
+def main_in_batches(data, n_batches, verdict_cache, call_log):
     chunks = split_data_into_chunks(data, n_batches)
     batch_results = []
     batch_times = []
@@ -118,7 +143,7 @@ def main_in_batches(data, n_batches):
 
         # Perform WL clustering on the current batch
         initial_clusters = recursive_wl_clustering(chunk)
-        final_clusters = postcluster_by_isomorphism(chunk, initial_clusters)
+        final_clusters = postcluster_by_isomorphism(chunk, initial_clusters, verdict_cache, call_log, node_match, edge_match)
 
         end_time = time.time()
         batch_time = end_time - start_time
@@ -136,9 +161,13 @@ def main_in_batches(data, n_batches):
 with open('reaction_centers.pkl', 'rb') as f:
     data = pickle.load(f)
 
-# Process data in batches
+# Process data in batches, reusing isomorphism verdicts computed by earlier runs
+verdict_cache = load_verdict_cache()
+call_log = new_call_log()
 n_batches = 20  # Adjust the number of batches as needed
-results, runtimes = main_in_batches(data, n_batches)
+results, runtimes = main_in_batches(data, n_batches, verdict_cache, call_log)
+save_verdict_cache(verdict_cache)
+report_call_log(call_log)
 
 # Output batch results
 for batch_idx, clusters in enumerate(results, 1):
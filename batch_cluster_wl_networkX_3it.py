@@ -3,6 +3,9 @@ import networkx as nx
 from networkx.algorithms.graph_hashing import weisfeiler_lehman_graph_hash
 import time
 import math
+from fingerprint_cache import fingerprint_key, load_fingerprint_cache, save_fingerprint_cache
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 
 
 # Node match function for isomorphism
@@ -15,53 +18,40 @@ def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
 
-# Function to prepare aggregated node attributes
+# Function to prepare aggregated node attributes on a separate label graph (the reaction center is not modified)
 def prepare_node_attributes(graph):
-    for node, attrs in graph.nodes(data=True):
-        attrs['aggregated'] = f"{attrs['element']}_{attrs['charge']}"
+    label_graph = nx.Graph()
+    label_graph.add_nodes_from(
+        (node, {'aggregated': f"{attrs['element']}_{attrs['charge']}"}) for node, attrs in graph.nodes(data=True)
+    )
+    label_graph.add_edges_from((u, v, {'order': attrs['order']}) for u, v, attrs in graph.edges(data=True))
+    return label_graph
 
 
-# Function to calculate WL graph hash
-def calculate_wl_hash(graph):
-    prepare_node_attributes(graph)
-    return weisfeiler_lehman_graph_hash(graph, node_attr='aggregated', edge_attr='order', iterations=3)
+# Function to calculate WL graph hash (looked up in the fingerprint cache first)
+def calculate_wl_hash(graph, fingerprint_cache):
+    key = fingerprint_key(graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    if key not in fingerprint_cache:
+        label_graph = prepare_node_attributes(graph)
+        fingerprint_cache[key] = weisfeiler_lehman_graph_hash(label_graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    return fingerprint_cache[key]
 
 
 # Function to cluster by WL graph hash
-def cluster_by_wl_hash(data):
+def cluster_by_wl_hash(data, fingerprint_cache):
     clusters = {}
     for i, rc in enumerate(data):
-        wl_hash = calculate_wl_hash(rc['reaction_center'])
+        wl_hash = calculate_wl_hash(rc['reaction_center'], fingerprint_cache)
         if wl_hash not in clusters:
             clusters[wl_hash] = []
         clusters[wl_hash].append(i)
     return list(clusters.values())
 
 
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data, invariant_clusters):
-    final_clusters = []
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
-
-
 # Function to process a batch
-def process_batch(batch_data):
-    invariant_clusters = cluster_by_wl_hash(batch_data)
-    final_clusters = postcluster_by_isomorphism(batch_data, invariant_clusters)
+def process_batch(batch_data, fingerprint_cache, verdict_cache, call_log):
+    invariant_clusters = cluster_by_wl_hash(batch_data, fingerprint_cache)
+    final_clusters = postcluster_by_isomorphism(batch_data, invariant_clusters, verdict_cache, call_log, node_match, edge_match)
     return final_clusters
 
 
@@ -72,7 +62,7 @@ def split_data_into_chunks(data, n):
 
 
 # Main function to process the dataset in batches
-def main_in_batches(data, n_batches):
+def main_in_batches(data, n_batches, fingerprint_cache, verdict_cache, call_log):
     chunks = split_data_into_chunks(data, n_batches)
     all_batch_results = []
     times = []
@@ -82,7 +72,7 @@ def main_in_batches(data, n_batches):
         start_time = time.time()
 
         # Process the current chunk
-        batch_result = process_batch(chunk)
+        batch_result = process_batch(chunk, fingerprint_cache, verdict_cache, call_log)
         all_batch_results.append(batch_result)
 
         end_time = time.time()
@@ -98,9 +88,15 @@ def main_in_batches(data, n_batches):
 with open('reaction_centers.pkl', 'rb') as f:
     data = pickle.load(f)
 
-# Run clustering in batches
+# Run clustering in batches, reusing WL fingerprints and isomorphism verdicts computed by earlier runs
+fingerprint_cache = load_fingerprint_cache()
+verdict_cache = load_verdict_cache()
+call_log = new_call_log()
 n_batches = 20  # Adjust the number of batches as needed
-results = main_in_batches(data, n_batches)
+results = main_in_batches(data, n_batches, fingerprint_cache, verdict_cache, call_log)
+save_fingerprint_cache(fingerprint_cache)
+save_verdict_cache(verdict_cache)
+report_call_log(call_log)
 batch_results = results[0]
 all_times = results[1]
 
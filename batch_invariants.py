@@ -0,0 +1,191 @@
+import pickle
+import time
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+from invariant_keys import group_by_keys, hashable_invariant
+from spectral_prefilter import size_classes
+from wl_csr_engine import dataset_to_csr, pack_disjoint_union
+
+# Maximum number of adjacency entries stacked into one batch of equally sized graphs in the shortest path pass
+SHORTEST_PATH_BATCH_ENTRIES = 1 << 22
+# Graphs with more nodes than this get their own sparse shortest path run instead of the stacked frontier expansion
+STACKED_PATH_MAX_NODES = 64
+
+# Fields of the structured invariant array (avg_shortest_path is NaN and diameter is -1 for disconnected graphs)
+INVARIANT_DTYPE = np.dtype([
+    ('num_nodes', np.int64),
+    ('num_edges', np.int64),
+    ('density', np.float64),
+    ('num_components', np.int64),
+    ('is_connected', np.bool_),
+    ('avg_shortest_path', np.float64),
+    ('diameter', np.int64),
+    ('triangles', np.int64),
+    ('min_degree', np.int64),
+    ('max_degree', np.int64),
+])
+
+
+# Function to pack all reaction centers into one block-diagonal sparse adjacency matrix
+def block_diagonal_adjacency(union):
+    num_nodes = len(union['node_graph'])
+    values = np.ones(len(union['indices']), dtype=np.float64)
+    return sp.csr_matrix((values, union['indices'], union['indptr']), shape=(num_nodes, num_nodes))
+
+
+# Function to stack the boolean adjacency matrices of equally sized graphs into one (k, n, n) array
+def stacked_adjacency(union, graph_ids, size):
+    node_ids = (union['graph_ptr'][graph_ids][:, None] + np.arange(size)).ravel()
+    starts = union['indptr'][node_ids]
+    counts = union['indptr'][node_ids + 1] - starts
+    # Positions of all CSR entries of these nodes, row by row
+    entry_ids = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    rows = np.repeat(np.arange(len(node_ids)), counts)
+    cols = union['indices'][entry_ids] - np.repeat(union['graph_ptr'][union['node_graph'][node_ids]], counts)
+    adjacency = np.zeros((len(graph_ids), size, size), dtype=bool)
+    adjacency[rows // size, rows % size, cols] = True
+    return adjacency
+
+
+# Function to compute the hop distances of stacked graphs by expanding all BFS frontiers at once (inf if unreachable)
+def stacked_distances(adjacency):
+    num_graphs, size, _ = adjacency.shape
+    distances = np.full(adjacency.shape, np.inf)
+    reached = np.broadcast_to(np.eye(size, dtype=bool), adjacency.shape).copy()
+    distances[reached] = 0
+    frontier = reached
+    for distance in range(1, size):
+        frontier = np.matmul(frontier, adjacency) & ~reached
+        if not frontier.any():
+            break
+        distances[frontier] = distance
+        reached |= frontier
+    return distances
+
+
+# Function to compute the sum of all shortest path lengths and the eccentricity maximum of every graph
+# (graphs are batched per size class, so no distance matrix spans more than one graph)
+def shortest_path_statistics(adjacency, union):
+    num_graphs = len(union['graph_ptr']) - 1
+    path_sums = np.zeros(num_graphs, dtype=np.float64)
+    diameters = np.zeros(num_graphs, dtype=np.int64)
+    for size, graph_ids in size_classes(union).items():
+        if size == 0:
+            continue
+        if size > STACKED_PATH_MAX_NODES:
+            for graph_id in graph_ids.tolist():
+                node_start, node_end = union['graph_ptr'][graph_id], union['graph_ptr'][graph_id + 1]
+                distances = csgraph.shortest_path(adjacency[node_start:node_end, node_start:node_end],
+                                                  method='D', directed=False, unweighted=True)
+                finite_distances = np.where(np.isfinite(distances), distances, 0)
+                path_sums[graph_id] = finite_distances.sum()
+                diameters[graph_id] = int(finite_distances.max())
+            continue
+        batch_size = max(SHORTEST_PATH_BATCH_ENTRIES // (size * size), 1)
+        for start in range(0, len(graph_ids), batch_size):
+            batch = graph_ids[start:start + batch_size]
+            distances = stacked_distances(stacked_adjacency(union, batch, size))
+            finite_distances = np.where(np.isfinite(distances), distances, 0)
+            path_sums[batch] = finite_distances.sum(axis=(1, 2))
+            diameters[batch] = finite_distances.max(axis=(1, 2)).astype(np.int64)
+    return path_sums, diameters
+
+
+# Function to compute the invariants of all reaction centers in a few array passes
+def batch_invariants(data):
+    union = pack_disjoint_union(dataset_to_csr(data))
+    adjacency = block_diagonal_adjacency(union)
+    node_graph = union['node_graph']
+    num_graphs = len(data)
+
+    num_nodes = np.diff(union['graph_ptr'])
+    degrees = np.diff(union['indptr'])
+    num_edges = np.bincount(node_graph, weights=degrees, minlength=num_graphs).astype(np.int64) // 2
+
+    # Components never cross graphs, so every component belongs to the graph of any of its nodes
+    num_all_components, component_labels = csgraph.connected_components(adjacency, directed=False)
+    component_graph = np.zeros(num_all_components, dtype=np.int64)
+    component_graph[component_labels] = node_graph
+    num_components = np.bincount(component_graph, minlength=num_graphs)
+
+    # Every triangle is counted twice at each of its three nodes by (A @ A) * A
+    node_triangles = np.asarray((adjacency @ adjacency).multiply(adjacency).sum(axis=1)).ravel()
+    triangles = np.round(np.bincount(node_graph, weights=node_triangles, minlength=num_graphs) / 6).astype(np.int64)
+
+    path_sums, diameters = shortest_path_statistics(adjacency, union)
+
+    invariants = np.zeros(num_graphs, dtype=INVARIANT_DTYPE)
+    invariants['num_nodes'] = num_nodes
+    invariants['num_edges'] = num_edges
+    num_pairs = num_nodes * (num_nodes - 1)
+    has_pairs = num_pairs > 0
+    # Same formulas as nx.density and nx.average_shortest_path_length
+    invariants['density'][has_pairs] = num_edges[has_pairs] / num_pairs[has_pairs] * 2
+    invariants['num_components'] = num_components
+    invariants['is_connected'] = num_components == 1
+    invariants['avg_shortest_path'] = np.nan
+    connected = invariants['is_connected']
+    invariants['avg_shortest_path'][connected] = 0.0
+    with_paths = connected & has_pairs
+    invariants['avg_shortest_path'][with_paths] = path_sums[with_paths] / num_pairs[with_paths]
+    invariants['diameter'] = np.where(connected, diameters, -1)
+    invariants['triangles'] = triangles
+
+    non_empty = num_nodes > 0
+    if len(degrees):
+        starts = union['graph_ptr'][:-1][non_empty]
+        invariants['min_degree'][non_empty] = np.minimum.reduceat(degrees, starts)
+        invariants['max_degree'][non_empty] = np.maximum.reduceat(degrees, starts)
+    return invariants, union
+
+
+# Function to get the sorted degree sequence of every graph
+def batch_degree_sequences(union):
+    if len(union['graph_ptr']) == 1:
+        return []
+    degrees = np.diff(union['indptr'])
+    order = np.lexsort((degrees, union['node_graph']))
+    return [tuple(sequence.tolist()) for sequence in np.split(degrees[order], union['graph_ptr'][1:-1])]
+
+
+# Function to build the invariant keys of invariants_clustering.py (degrees, density, average shortest path)
+def batch_invariant_keys(invariants, degree_sequences):
+    keys = []
+    for record, degrees in zip(invariants, degree_sequences):
+        avg_shortest_path = float(record['avg_shortest_path']) if record['is_connected'] else None
+        keys.append(hashable_invariant((degrees, float(record['density']), avg_shortest_path)))
+    return keys
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Larger_rcs.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    # Benchmark against the per-graph networkx loop computing the same invariants
+    start = time.time()
+    for item in data:
+        graph = item['reaction_center']
+        degrees = sorted(dict(graph.degree()).values())
+        density = nx.density(graph)
+        triangles = sum(nx.triangles(graph).values()) // 3
+        connected = nx.is_connected(graph) if graph.number_of_nodes() else False
+        avg_shortest_path = nx.average_shortest_path_length(graph) if connected else None
+        diameter = nx.diameter(graph) if connected else -1
+    end = time.time()
+    print(f"Time for per-graph networkx invariants: {end - start:.2f}s")
+
+    start = time.time()
+    invariants, union = batch_invariants(data)
+    degree_sequences = batch_degree_sequences(union)
+    end = time.time()
+    print(f"Time for batch invariants: {end - start:.2f}s")
+
+    clusters, _ = group_by_keys(batch_invariant_keys(invariants, degree_sequences))
+    print(f"Number of groups based on invariants: {len(clusters)}")
+    print(f"Connected reaction centers: {int(invariants['is_connected'].sum())} of {len(invariants)}")
@@ -3,6 +3,9 @@ import networkx as nx
 from networkx.algorithms.graph_hashing import weisfeiler_lehman_graph_hash
 import time
 import csv
+from fingerprint_cache import fingerprint_key, load_fingerprint_cache, save_fingerprint_cache
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 from synutility.SynVis.graph_visualizer import GraphVisualizer
 
 # Function to split the dataset into batches
@@ -10,45 +13,33 @@ def split_dataset(data, num_batches):
     batch_size = len(data) // num_batches
     return [data[i * batch_size: (i + 1) * batch_size] for i in range(num_batches)]
 
-# Function to prepare aggregated node attributes
+# Function to prepare aggregated node attributes on a separate label graph (the reaction center is not modified)
 def prepare_node_attributes(graph):
-    for node, attrs in graph.nodes(data=True):
-        attrs['aggregated'] = f"{attrs['element']}_{attrs['charge']}"
-
-# Function to calculate WL graph hash
-def calculate_wl_hash(graph):
-    prepare_node_attributes(graph)
-    return weisfeiler_lehman_graph_hash(graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    label_graph = nx.Graph()
+    label_graph.add_nodes_from(
+        (node, {'aggregated': f"{attrs['element']}_{attrs['charge']}"}) for node, attrs in graph.nodes(data=True)
+    )
+    label_graph.add_edges_from((u, v, {'order': attrs['order']}) for u, v, attrs in graph.edges(data=True))
+    return label_graph
+
+# Function to calculate WL graph hash (looked up in the fingerprint cache first)
+def calculate_wl_hash(graph, fingerprint_cache):
+    key = fingerprint_key(graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    if key not in fingerprint_cache:
+        label_graph = prepare_node_attributes(graph)
+        fingerprint_cache[key] = weisfeiler_lehman_graph_hash(label_graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    return fingerprint_cache[key]
 
 # Function to cluster by WL graph hash
-def cluster_by_wl_hash(data_batch):
+def cluster_by_wl_hash(data_batch, fingerprint_cache):
     clusters = {}
     for i, rc in enumerate(data_batch):
-        wl_hash = calculate_wl_hash(rc['reaction_center'])
+        wl_hash = calculate_wl_hash(rc['reaction_center'], fingerprint_cache)
         if wl_hash not in clusters:
             clusters[wl_hash] = []
         clusters[wl_hash].append(i)
     return list(clusters.values())
 
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data_batch, invariant_clusters):
-    final_clusters = []
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data_batch[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data_batch[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
-
 def node_match(n1, n2):
     return n1['charge'] == n2['charge'] and n1['element'] == n2['element']
 
@@ -56,16 +47,16 @@ def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
 # Batch processing function
-def process_batch(data_batch, batch_idx):
+def process_batch(data_batch, batch_idx, fingerprint_cache, verdict_cache, call_log):
     # Step 1: WL Clustering
     start_wl = time.time()
-    wl_clusters = cluster_by_wl_hash(data_batch)
+    wl_clusters = cluster_by_wl_hash(data_batch, fingerprint_cache)
     end_wl = time.time()
     wl_time = end_wl - start_wl
 
     # Step 2: Post-clustering by isomorphism
     start_iso = time.time()
-    final_clusters = postcluster_by_isomorphism(data_batch, wl_clusters)
+    final_clusters = postcluster_by_isomorphism(data_batch, wl_clusters, verdict_cache, call_log, node_match, edge_match)
     end_iso = time.time()
     iso_time = end_iso - start_iso
 
@@ -92,11 +83,17 @@ def main():
     num_batches = 20
     batches = split_dataset(data, num_batches)
 
-    # Process each batch
+    # Process each batch, reusing WL fingerprints and isomorphism verdicts computed by earlier runs
+    fingerprint_cache = load_fingerprint_cache()
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     results = []
     for batch_idx, batch in enumerate(batches, start=1):
-        result = process_batch(batch, batch_idx)
+        result = process_batch(batch, batch_idx, fingerprint_cache, verdict_cache, call_log)
         results.append(result)
+    save_fingerprint_cache(fingerprint_cache)
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Save results to CSV
     output_file = 'Large_batch_networkx_wl_results.csv'
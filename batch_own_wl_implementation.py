@@ -1,94 +1,110 @@
 import pickle
-import networkx as nx
 from collections import Counter, defaultdict
 import time
 import csv
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 
 # Function to split the dataset into batches
 def split_dataset(data, num_batches):
     batch_size = len(data) // num_batches
     return [data[i * batch_size: (i + 1) * batch_size] for i in range(num_batches)]
 
+# Function to collect the neighbor positions and edge order codes of every node (the graph is not modified)
+def build_neighborhoods(graph, edge_order_table):
+    node_index = {node: i for i, node in enumerate(graph.nodes())}
+    neighborhoods = []
+    for node, neighbors in graph.adjacency():
+        neighborhood = []
+        for neighbor, edge_attrs in neighbors.items():
+            order = edge_attrs['order']
+            if order not in edge_order_table:
+                edge_order_table[order] = len(edge_order_table)
+            neighborhood.append((node_index[neighbor], edge_order_table[order]))
+        neighborhoods.append(neighborhood)
+    return neighborhoods
+
 # Function to initialize node labels WITH edge labels
-def initialize_labels(graph):
-    for node, attrs in graph.nodes(data=True):
-        base_label = f"{attrs['element']}_{attrs['charge']}"
-        neighbor_edge_orders = sorted([str(graph[node][neighbor]['order']) for neighbor in graph.neighbors(node)])
-        attrs['label'] = f"{base_label},{','.join(neighbor_edge_orders)}"
+def initialize_labels(graph, neighborhoods, initial_hash_table):
+    labels = []
+    for (node, attrs), neighborhood in zip(graph.nodes(data=True), neighborhoods):
+        initial_label = (attrs['element'], attrs['charge']) + tuple(sorted(order for _, order in neighborhood))
+        if initial_label not in initial_hash_table:
+            initial_hash_table[initial_label] = len(initial_hash_table)
+        labels.append(initial_hash_table[initial_label])
+    return labels
 
 # Function to perform a single Weisfeiler-Lehman iteration using a shared hash table
-def wl_iteration_with_shared_hash(graph, shared_hash_table):
-    new_labels = {}
-    for node, attrs in graph.nodes(data=True):
-        current_label = attrs['label']
-        neighbor_labels = sorted([
-            f"{graph.nodes[neighbor]['label']}_{graph[node][neighbor]['order']}"
-            for neighbor in graph.neighbors(node)
-        ])
-        aggregated_label = f"{current_label},{','.join(neighbor_labels)}"
+def wl_iteration_with_shared_hash(labels, neighborhoods, shared_hash_table):
+    new_labels = []
+    for current_label, neighborhood in zip(labels, neighborhoods):
+        neighbor_labels = sorted([(labels[neighbor], order) for neighbor, order in neighborhood])
+        aggregated_label = (current_label,) + tuple(neighbor_labels)
         if aggregated_label not in shared_hash_table:
             shared_hash_table[aggregated_label] = len(shared_hash_table)
-        new_labels[node] = shared_hash_table[aggregated_label]
-    for node, new_label in new_labels.items():
-        graph.nodes[node]['label'] = str(new_label)
+        new_labels.append(shared_hash_table[aggregated_label])
+    return new_labels
 
 # Function to generate histogram of labels
-def generate_histogram(graph):
-    labels = [attrs['label'] for _, attrs in graph.nodes(data=True)]
+def generate_histogram(labels):
     histogram = Counter(labels)
     return histogram
 
 # Function to perform WL clustering within a set of graphs
-def wl_clustering(graphs, shared_hash_table):
+def wl_clustering(graph_indices, graph_labels, graph_neighborhoods, shared_hash_table, num_labels, frozen_graphs):
     graph_histograms = {}
-    for graph_idx, graph in graphs.items():
-        wl_iteration_with_shared_hash(graph, shared_hash_table)
-        histogram = generate_histogram(graph)
+    for graph_idx in graph_indices:
+        graph_labels[graph_idx] = wl_iteration_with_shared_hash(graph_labels[graph_idx], graph_neighborhoods[graph_idx],
+                                                                shared_hash_table)
+        histogram = generate_histogram(graph_labels[graph_idx])
         graph_histograms[graph_idx] = histogram
+        if len(histogram) == num_labels[graph_idx]:
+            frozen_graphs.add(graph_idx)
+        num_labels[graph_idx] = len(histogram)
     clusters = defaultdict(list)
     for graph_idx, histogram in graph_histograms.items():
         histogram_tuple = tuple(sorted(histogram.items()))
         clusters[histogram_tuple].append(graph_idx)
     return clusters
 
+# Function to split clusters into the worklist (clusters that may still split) and the final clusters
+def schedule_clusters(clusters, worklist, final_clusters, frozen_graphs):
+    for cluster_graphs in clusters:
+        # Singletons and clusters of frozen graphs can never split, retire them permanently
+        # (graphs of one cluster always share their frozen state, so checking the first one is enough)
+        if len(cluster_graphs) == 1 or cluster_graphs[0] in frozen_graphs:
+            final_clusters.append(cluster_graphs)
+        else:
+            worklist.append(cluster_graphs)
+
 # Function to perform recursive WL clustering
 def recursive_wl_clustering(data):
     shared_hash_table = {}
-    clusters = defaultdict(list)
-    graphs = {i: item['reaction_center'] for i, item in enumerate(data)}
-    for graph in graphs.values():
-        initialize_labels(graph)
-    clusters = wl_clustering(graphs, shared_hash_table)
-    while True:
-        new_clusters = defaultdict(list)
-        shared_hash_table = {}
-        for cluster_graphs in clusters.values():
-            cluster_subgraphs = {idx: graphs[idx] for idx in cluster_graphs}
-            sub_clusters = wl_clustering(cluster_subgraphs, shared_hash_table)
-            for sub_cluster_key, sub_cluster_graphs in sub_clusters.items():
-                new_clusters[sub_cluster_key].extend(sub_cluster_graphs)
-        if len(new_clusters) == len(clusters):
-            break
-        clusters = new_clusters
-    return list(clusters.values())
-
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data, invariant_clusters):
+    initial_hash_table = {}
+    edge_order_table = {}
+    graph_neighborhoods = {}
+    graph_labels = {}
+    num_labels = {}
+    frozen_graphs = set()
+    for graph_idx, item in enumerate(data):
+        graph = item['reaction_center']
+        graph_neighborhoods[graph_idx] = build_neighborhoods(graph, edge_order_table)
+        graph_labels[graph_idx] = initialize_labels(graph, graph_neighborhoods[graph_idx], initial_hash_table)
+        num_labels[graph_idx] = len(generate_histogram(graph_labels[graph_idx]))
+    clusters = wl_clustering(range(len(data)), graph_labels, graph_neighborhoods, shared_hash_table,
+                             num_labels, frozen_graphs)
     final_clusters = []
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
+    worklist = []
+    schedule_clusters(clusters.values(), worklist, final_clusters, frozen_graphs)
+    while worklist:
+        new_worklist = []
+        shared_hash_table = {}
+        for cluster_graphs in worklist:
+            sub_clusters = wl_clustering(cluster_graphs, graph_labels, graph_neighborhoods, shared_hash_table,
+                                         num_labels, frozen_graphs)
+            # A cluster that did not split stays on the worklist until its graphs are frozen
+            schedule_clusters(sub_clusters.values(), new_worklist, final_clusters, frozen_graphs)
+        worklist = new_worklist
     return final_clusters
 
 def node_match(n1, n2):
@@ -98,14 +114,14 @@ def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
 # Batch processing function
-def process_batch(batch, batch_idx):
+def process_batch(batch, batch_idx, verdict_cache, call_log):
     wl_start = time.time()
     final_clusters = recursive_wl_clustering(batch)
     wl_end = time.time()
     wl_time = wl_end - wl_start
 
     iso_start = time.time()
-    post_iso_clusters = postcluster_by_isomorphism(batch, final_clusters)
+    post_iso_clusters = postcluster_by_isomorphism(batch, final_clusters, verdict_cache, call_log, node_match, edge_match)
     iso_end = time.time()
     iso_time = iso_end - iso_start
 
@@ -129,9 +145,14 @@ if __name__ == "__main__":
     batches = split_dataset(data, num_batches)
     results = []
 
+    # Reuse isomorphism verdicts of earlier runs
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     for batch_idx, batch in enumerate(batches, start=1):
-        result = process_batch(batch, batch_idx)
+        result = process_batch(batch, batch_idx, verdict_cache, call_log)
         results.append(result)
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Save results to a CSV file
     with open('Large_batch_own_wl_results.csv', 'w', newline='') as f:
@@ -0,0 +1,216 @@
+import pickle
+import time
+
+from wl_csr_engine import recursive_wl_clustering_union
+
+
+# Raised by the canonical search when it runs out of its time budget
+class CanonicalSearchBudgetExceeded(Exception):
+    pass
+
+
+# Function to compile a reaction center into node positions, label codes and neighborhoods
+# (codes are ranks of the sorted label values, so they are comparable between different graphs' certificates)
+def compile_graph(graph):
+    nodes = list(graph.nodes())
+    node_index = {node: i for i, node in enumerate(nodes)}
+
+    node_labels = [(attrs['element'], attrs['charge']) for _, attrs in graph.nodes(data=True)]
+    label_values = sorted(set(node_labels))
+    label_codes = {label: code for code, label in enumerate(label_values)}
+
+    order_values = sorted({attrs['order'] for _, _, attrs in graph.edges(data=True)})
+    order_codes = {order: code for code, order in enumerate(order_values)}
+
+    neighborhoods = []
+    for node, neighbors in graph.adjacency():
+        neighborhoods.append([(node_index[neighbor], order_codes[edge_attrs['order']])
+                              for neighbor, edge_attrs in neighbors.items()])
+
+    edges = [(node_index[u], node_index[v], order_codes[attrs['order']]) for u, v, attrs in graph.edges(data=True)]
+    return {
+        'colors': [label_codes[label] for label in node_labels],
+        'neighborhoods': neighborhoods,
+        'edges': edges,
+        'label_values': label_values,
+        'order_values': order_values,
+    }
+
+
+# Function to rank-compress a list of keys (equal keys get equal colors, colors follow the sorted key order)
+def rank_colors(keys):
+    ranks = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+    return [ranks[key] for key in keys]
+
+
+# Function to refine colors until the partition is equitable (WL refinement WITH edge orders)
+def refine_colors(colors, neighborhoods):
+    num_colors = len(set(colors))
+    while True:
+        # The old color comes first in the key, so refinement never reorders existing cells
+        keys = [(colors[node], tuple(sorted((colors[neighbor], order) for neighbor, order in neighborhood)))
+                for node, neighborhood in enumerate(neighborhoods)]
+        new_colors = rank_colors(keys)
+        num_new_colors = len(set(new_colors))
+        if num_new_colors == num_colors:
+            return new_colors
+        colors = new_colors
+        num_colors = num_new_colors
+
+
+# Function to give one node its own color, placed just before the rest of its cell
+def individualize(colors, node):
+    return rank_colors([2 * color + (0 if other == node else 1) for other, color in enumerate(colors)])
+
+
+# Function to select the cell to branch on (the first non-singleton cell in color order)
+def target_cell(colors):
+    cells = {}
+    for node, color in enumerate(colors):
+        cells.setdefault(color, []).append(node)
+    for color in sorted(cells):
+        if len(cells[color]) > 1:
+            return cells[color]
+    return None
+
+
+# Function to build the certificate of a discrete coloring (node labels and edges in canonical order)
+def leaf_certificate(compiled, colors):
+    node_codes = [0] * len(colors)
+    for node, color in enumerate(colors):
+        node_codes[color] = compiled['colors'][node]
+    edges = sorted((min(colors[u], colors[v]), max(colors[u], colors[v]), order) for u, v, order in compiled['edges'])
+    return tuple(node_codes), tuple(edges)
+
+
+# Function to find the representative of a node in the union-find structure of the automorphism orbits
+def find_orbit(parents, node):
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
+
+# Function to merge the orbits of the automorphisms found since the last call that fix all individualized nodes
+# (every search node keeps its own union-find and only looks at each automorphism once, and only at the nodes it moves)
+def update_orbits(orbits, automorphisms, fixed_nodes):
+    parents = orbits['parents']
+    for automorphism, moved_nodes in automorphisms[orbits['num_seen']:]:
+        if any(automorphism[node] != node for node in fixed_nodes):
+            continue
+        for node in moved_nodes:
+            image = automorphism[node]
+            root, image_root = find_orbit(parents, node), find_orbit(parents, image)
+            if root != image_root:
+                parents[max(root, image_root)] = min(root, image_root)
+    orbits['num_seen'] = len(automorphisms)
+
+
+# Function to count the leading individualized nodes two paths of the search tree share
+def common_prefix_length(path1, path2):
+    length = 0
+    for node1, node2 in zip(path1, path2):
+        if node1 != node2:
+            break
+        length += 1
+    return length
+
+
+# Function to search the individualization-refinement tree for the smallest leaf certificate
+# (returns the level to jump back to after an automorphism was found, None to continue normally)
+def search_canonical_leaf(compiled, colors, fixed_nodes, state):
+    if state['deadline'] is not None and time.perf_counter() > state['deadline']:
+        raise CanonicalSearchBudgetExceeded()
+    colors = refine_colors(colors, compiled['neighborhoods'])
+    cell = target_cell(colors)
+
+    if cell is None:
+        certificate = leaf_certificate(compiled, colors)
+        # Two leaves with the same certificate differ by an automorphism of the graph, it fixes the path the two
+        # leaves share and maps the rest of this subtree onto an explored one, so the search jumps back there
+        for leaf_certificate_, leaf_colors, leaf_path in (state['first'], state['best']):
+            if certificate == leaf_certificate_:
+                position_to_node = {color: node for node, color in enumerate(leaf_colors)}
+                automorphism = tuple(position_to_node[color] for color in colors)
+                if automorphism not in state['automorphism_set']:
+                    state['automorphism_set'].add(automorphism)
+                    moved_nodes = [node for node, image in enumerate(automorphism) if image != node]
+                    state['automorphisms'].append((automorphism, moved_nodes))
+                return common_prefix_length(fixed_nodes, leaf_path)
+        if state['best'][0] is None or certificate < state['best'][0]:
+            state['best'] = (certificate, colors, fixed_nodes)
+        if state['first'][0] is None:
+            state['first'] = (certificate, colors, fixed_nodes)
+        return None
+
+    # Nodes in the same orbit of the point stabilizer lead to equivalent subtrees, only one of them is explored
+    level = len(fixed_nodes)
+    orbits = {'parents': list(range(len(colors))), 'num_seen': 0}
+    explored_orbits = set()
+    for node in cell:
+        update_orbits(orbits, state['automorphisms'], fixed_nodes)
+        orbit = find_orbit(orbits['parents'], node)
+        if orbit in explored_orbits:
+            continue
+        explored_orbits.add(orbit)
+        jump_level = search_canonical_leaf(compiled, individualize(colors, node), fixed_nodes + [node], state)
+        if jump_level is not None and jump_level < level:
+            return jump_level
+    return None
+
+
+# Function to compute the canonical certificate of a reaction center
+# (two reaction centers have the same certificate exactly when they are isomorphic w.r.t. element, charge and order,
+# the search raises CanonicalSearchBudgetExceeded if a time budget is given and used up)
+def canonical_certificate(graph, time_budget=None):
+    compiled = compile_graph(graph)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    state = {'first': (None, None, None), 'best': (None, None, None), 'automorphisms': [],
+             'automorphism_set': set(), 'deadline': deadline}
+    search_canonical_leaf(compiled, compiled['colors'], [], state)
+
+    node_codes, edges = state['best'][0]
+    # Codes are translated back to label values, so certificates of different graphs can be compared
+    node_labels = tuple(compiled['label_values'][code] for code in node_codes)
+    edges = tuple((u, v, compiled['order_values'][order]) for u, v, order in edges)
+    return node_labels, edges
+
+
+# Function to post-cluster by isomorphism with canonical certificates (drop-in for postcluster_by_isomorphism)
+def postcluster_by_canonical_form(data, invariant_clusters):
+    final_clusters = []
+    for group in invariant_clusters:
+        # A reaction center alone in its group needs no certificate
+        if len(group) == 1:
+            final_clusters.append(list(group))
+            continue
+        # Dicts keep insertion order, so the sub-clusters come out in the same order as with pairwise tests
+        sub_clusters = {}
+        for idx in group:
+            certificate = canonical_certificate(data[idx]['reaction_center'])
+            sub_clusters.setdefault(certificate, []).append(idx)
+        final_clusters.extend(sub_clusters.values())
+    return final_clusters
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Small_RCs_khop_2.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    wl_start = time.time()
+    final_clusters = recursive_wl_clustering_union(data, verbose=False)
+    wl_end = time.time()
+    wl_time = wl_end - wl_start
+    print(f"Time for WL-Implementation: {wl_time:.2f}s")
+
+    iso_start = time.time()
+    post_iso_clusters = postcluster_by_canonical_form(data, final_clusters)
+    iso_end = time.time()
+    iso_time = iso_end - iso_start
+    print(f"Time for Post Clustering by canonical form: {iso_time:.2f}s")
+
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")
+    print(f"Final number of clusters after canonical form: {len(post_iso_clusters)}")
+    print(f"Time in total: {wl_time + iso_time:.2f}s")
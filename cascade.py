@@ -0,0 +1,136 @@
+import pickle
+import time
+
+from canonical_form import postcluster_by_canonical_form
+from composition_fingerprints import composition_ids
+from integer_matcher import compile_dataset, postcluster_by_compiled_isomorphism
+from parallel_postclustering import postcluster_by_isomorphism_parallel
+from wl_hashing import wl_fingerprints
+
+# Exact isomorphism strategies usable as the last stage of a cascade, with what their cost grows with
+# ('graphs': graphs in non-singleton buckets, 'pairs': pairs inside the buckets)
+ISOMORPHISM_METHODS = {
+    'canonical': (postcluster_by_canonical_form, 'graphs'),
+    'compiled': (postcluster_by_compiled_isomorphism, 'pairs'),
+    'parallel': (postcluster_by_isomorphism_parallel, 'pairs'),
+}
+
+
+# Function to calculate the sorted degree sequence
+def degree_key(graph):
+    return tuple(sorted(degree for _, degree in graph.degree()))
+
+
+# Function to split every bucket by the keys of its graphs (sub-buckets keep the order of their first member)
+def split_buckets(buckets, keys):
+    new_buckets = []
+    for bucket in buckets:
+        # Singletons cannot split any further and have no key
+        if len(bucket) == 1:
+            new_buckets.append(bucket)
+            continue
+        sub_buckets = {}
+        for idx in bucket:
+            sub_buckets.setdefault(keys[idx], []).append(idx)
+        new_buckets.extend(sub_buckets.values())
+    return new_buckets
+
+
+# Function to create a stage from a per-graph key function
+def graph_key_stage(name, key_function):
+    def refine(data, buckets):
+        keys = {idx: key_function(data[idx]['reaction_center']) for bucket in buckets if len(bucket) > 1 for idx in bucket}
+        return split_buckets(buckets, keys)
+    return {'name': name, 'refine': refine, 'cost_model': 'graphs'}
+
+
+# Function to create a stage from composition count vectors (ids computed in one pass for all graphs to refine)
+def composition_stage(name, parts):
+    def refine(data, buckets):
+        indices = [idx for bucket in buckets if len(bucket) > 1 for idx in bucket]
+        keys = composition_ids([data[idx] for idx in indices], parts)
+        return split_buckets(buckets, dict(zip(indices, keys)))
+    return {'name': name, 'refine': refine, 'cost_model': 'graphs'}
+
+
+# Function to create the element count stage
+def element_count_stage():
+    return composition_stage('element counts', ('elements',))
+
+
+# Function to create the bond order count stage
+def bond_order_stage():
+    return composition_stage('bond order counts', ('orders',))
+
+
+# Function to create the combined element/charge and bond order stage
+def composition_fingerprint_stage():
+    return composition_stage('element/charge and bond order counts', ('element_charges', 'orders'))
+
+
+# Function to create the degree sequence stage
+def degree_stage():
+    return graph_key_stage('degree invariants', degree_key)
+
+
+# Function to create the WL hash stage (deterministic fingerprints, computed in one pass for all graphs to refine)
+def wl_hash_stage(iterations=3):
+    def refine(data, buckets):
+        indices = [idx for bucket in buckets if len(bucket) > 1 for idx in bucket]
+        fingerprints = wl_fingerprints([data[idx] for idx in indices], iterations=iterations)
+        return split_buckets(buckets, dict(zip(indices, fingerprints.tolist())))
+    return {'name': f'WL hash ({iterations} iterations)', 'refine': refine, 'cost_model': 'graphs'}
+
+
+# Function to create the exact isomorphism stage
+def isomorphism_stage(method='canonical'):
+    postcluster, cost_model = ISOMORPHISM_METHODS[method]
+    stage = {'name': f'isomorphism ({method})', 'refine': postcluster, 'cost_model': cost_model}
+    if cost_model == 'pairs':
+        # Compiling and matching are timed separately by the planner (the parallel method does the same work in workers)
+        stage['compile'] = compile_dataset
+        stage['match'] = postcluster_by_compiled_isomorphism
+    return stage
+
+
+# Function to collect the bucket statistics of a partition
+def bucket_statistics(buckets):
+    sizes = [len(bucket) for bucket in buckets]
+    return {
+        'buckets': len(buckets),
+        'singletons': sizes.count(1),
+        'largest_bucket': max(sizes, default=0),
+        # Number of pairs a pairwise test would still have to look at in the worst case
+        'pairs': sum(size * (size - 1) // 2 for size in sizes),
+    }
+
+
+# Function to run a cascade of stages, each refining the partition of the previous one
+def run_cascade(data, stages, verbose=True):
+    buckets = [list(range(len(data)))] if len(data) else []
+    stage_stats = []
+    for stage in stages:
+        start = time.time()
+        buckets = stage['refine'](data, buckets)
+        end = time.time()
+
+        stats = {'stage': stage['name'], 'time': end - start}
+        stats.update(bucket_statistics(buckets))
+        stage_stats.append(stats)
+        if verbose:
+            print(f"{stats['stage']}: {stats['time']:.2f}s, buckets = {stats['buckets']}, "
+                  f"singletons = {stats['singletons']}, largest bucket = {stats['largest_bucket']}, "
+                  f"open pairs = {stats['pairs']}")
+    return buckets, stage_stats
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Small_RCs_khop_2.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    stages = [element_count_stage(), bond_order_stage(), wl_hash_stage(), isomorphism_stage('canonical')]
+    final_clusters, stage_stats = run_cascade(data, stages)
+    print(f"Time in total: {sum(stats['time'] for stats in stage_stats):.2f}s")
+    print(f"Final number of clusters: {len(final_clusters)}")
@@ -0,0 +1,135 @@
+import itertools
+import pickle
+import random
+import time
+
+from cascade import (bond_order_stage, bucket_statistics, degree_stage, element_count_stage, isomorphism_stage,
+                     run_cascade, split_buckets, wl_hash_stage)
+from spectral_prefilter import spectral_stage
+
+# Number of reaction centers the planner measures the stages on
+PLANNER_SAMPLE_SIZE = 500
+
+
+# Function to draw a reproducible random sample of the dataset
+def sample_dataset(data, sample_size=PLANNER_SAMPLE_SIZE, seed=0):
+    indices = sorted(random.Random(seed).sample(range(len(data)), min(sample_size, len(data))))
+    return [data[idx] for idx in indices]
+
+
+# Function to measure a prefilter on the sample (cost per graph and the bucket each sample graph ends up in)
+def measure_prefilter(stage, sample):
+    start = time.time()
+    buckets = stage['refine'](sample, [list(range(len(sample)))])
+    end = time.time()
+    keys = [0] * len(sample)
+    for bucket_id, bucket in enumerate(buckets):
+        for idx in bucket:
+            keys[idx] = bucket_id
+    return {'stage': stage, 'cost_per_graph': (end - start) / len(sample), 'keys': keys}
+
+
+# Function to simulate a plan on the sample (graphs every stage has to key and the buckets left at the end)
+def simulate_plan(measurements, plan, num_graphs):
+    buckets = [list(range(num_graphs))]
+    graphs_per_stage = []
+    for stage_idx in plan:
+        graphs_per_stage.append(sum(len(bucket) for bucket in buckets if len(bucket) > 1))
+        buckets = split_buckets(buckets, measurements[stage_idx]['keys'])
+    return graphs_per_stage, buckets
+
+
+# Function to count the units the cost of a stage grows with in a partition ('graphs' or 'pairs')
+def cost_units(buckets, cost_model):
+    if cost_model == 'pairs':
+        return bucket_statistics(buckets)['pairs']
+    return sum(len(bucket) for bucket in buckets if len(bucket) > 1)
+
+
+# Function to measure the per-graph preparation cost of the final stage on the sample
+# (compiling is independent of the partition, so it is timed once and charged per graph in non-singleton buckets)
+def measure_compile_cost(final_stage, sample):
+    if 'compile' not in final_stage:
+        return 0.0, None
+    start = time.time()
+    compiled_graphs = final_stage['compile'](sample)
+    end = time.time()
+    return (end - start) / len(sample), compiled_graphs
+
+
+# Function to measure the runtime of the final stage on a partition of the sample (compiling excluded)
+def measure_final_stage(final_stage, sample, buckets, compiled_graphs=None):
+    start = time.time()
+    if 'match' in final_stage:
+        final_stage['match'](sample, buckets, compiled_graphs)
+    else:
+        final_stage['refine'](sample, buckets)
+    end = time.time()
+    return end - start
+
+
+# Function to estimate the runtime of a plan on the full dataset from the sample measurements
+# (graph counts scale with 1/fraction, the pairwise matching with 1/fraction^2)
+def expected_cost(measurements, plan, final_stage, final_times, compile_cost, num_sample, fraction):
+    graphs_per_stage, buckets = simulate_plan(measurements, plan, num_sample)
+    cost = sum(measurements[stage_idx]['cost_per_graph'] * num_graphs / fraction
+               for stage_idx, num_graphs in zip(plan, graphs_per_stage))
+    cost += compile_cost * cost_units(buckets, 'graphs') / fraction
+    scale = fraction ** 2 if final_stage['cost_model'] == 'pairs' else fraction
+    return cost + final_times[frozenset(plan)] / scale
+
+
+# Function to pick the order and subset of prefilters with the lowest expected total runtime
+def plan_cascade(data, prefilter_stages=None, final_stage=None, sample_size=PLANNER_SAMPLE_SIZE, seed=0, verbose=True):
+    if prefilter_stages is None:
+        prefilter_stages = [element_count_stage(), bond_order_stage(), degree_stage(), spectral_stage(), wl_hash_stage()]
+    if final_stage is None:
+        final_stage = isomorphism_stage('compiled')
+    if not data:
+        return [final_stage]
+
+    sample = sample_dataset(data, sample_size, seed)
+    fraction = len(sample) / len(data)
+    measurements = [measure_prefilter(stage, sample) for stage in prefilter_stages]
+
+    # The final partition only depends on the set of prefilters, not on their order, so the final stage is
+    # timed once per subset on the pairs that subset actually leaves (cheap rejections included)
+    compile_cost, compiled_graphs = measure_compile_cost(final_stage, sample)
+    final_times = {}
+    for num_stages in range(len(measurements) + 1):
+        for subset in itertools.combinations(range(len(measurements)), num_stages):
+            _, buckets = simulate_plan(measurements, subset, len(sample))
+            final_times[frozenset(subset)] = measure_final_stage(final_stage, sample, buckets, compiled_graphs)
+
+    # Every ordered subset of the prefilters is a candidate plan (fewer stages win ties)
+    best_plan, best_cost = (), None
+    for num_stages in range(len(measurements) + 1):
+        for plan in itertools.permutations(range(len(measurements)), num_stages):
+            cost = expected_cost(measurements, plan, final_stage, final_times, compile_cost, len(sample), fraction)
+            if best_cost is None or cost < best_cost:
+                best_plan, best_cost = plan, cost
+
+    stages = [measurements[stage_idx]['stage'] for stage_idx in best_plan] + [final_stage]
+    if verbose:
+        for measurement in measurements:
+            print(f"{measurement['stage']['name']}: {measurement['cost_per_graph'] * 1e6:.1f} us per graph")
+        if compile_cost:
+            print(f"{final_stage['name']} compiling: {compile_cost * 1e6:.1f} us per graph")
+        print(f"Chosen plan: {' -> '.join(stage['name'] for stage in stages)} (expected {best_cost:.2f}s)")
+    return stages
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Small_RCs_khop_2.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    plan_start = time.time()
+    stages = plan_cascade(data)
+    plan_end = time.time()
+    print(f"Time for planning: {plan_end - plan_start:.2f}s")
+
+    final_clusters, stage_stats = run_cascade(data, stages)
+    print(f"Time in total: {sum(stats['time'] for stats in stage_stats):.2f}s")
+    print(f"Final number of clusters: {len(final_clusters)}")
@@ -1,39 +1,18 @@
 import pickle
-import networkx as nx
-from collections import Counter
+from composition_fingerprints import cluster_by_composition
 import time
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 
 # Load data
 with open('reaction_centers.pkl', 'rb') as f:
     data = pickle.load(f)
 
 
-# Function to calculate bond order counts
-def calculate_bond_order_counts(graph):
-    # Extract bond orders (tuples) for all edges
-    bond_orders = [e[2]['order'] for e in graph.edges(data=True)]
-    # Count occurrences of each bond order tuple
-    bond_order_counts = Counter(bond_orders)
-    # Convert to sorted string format for consistent representation
-    sorted_bond_orders = sorted(bond_order_counts.items())
-    bond_order_string = "".join(f"{order}:{count}" for order, count in sorted_bond_orders)
-    return bond_order_string
-
-
 # Function to cluster by bond order counts
 def cluster_by_bond_order_counts(data):
-    clusters = {}
-
-    for i, rc in enumerate(data):
-        # Calculate bond order string for the current RC
-        bond_order_string = calculate_bond_order_counts(rc['reaction_center'])
-
-        # Group by bond order string
-        if bond_order_string not in clusters:
-            clusters[bond_order_string] = []
-        clusters[bond_order_string].append(i)
-
-    return list(clusters.values())  # Return clusters as a list of lists
+    # Count vectors over interned bond order tuples replace the "(1.0, 2.0):3" strings (same grouping)
+    return cluster_by_composition(data, ('orders',))  # Return clusters as a list of lists
 
 
 # Main function to combine both clustering methods and measure time
@@ -46,9 +25,13 @@ def main():
     end_bond_clustering = time.time()
 
     # Step 2: Post-cluster by isomorphism within each bond-based cluster
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     start_isomorphism_clustering = time.time()
-    final_clusters = postcluster_by_isomorphism(data, bond_clusters)
+    final_clusters = postcluster_by_isomorphism(data, bond_clusters, verdict_cache, call_log, node_match, edge_match)
     end_isomorphism_clustering = time.time()
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Total time
     total_time = (end_bond_clustering - start_bond_clustering) + (
@@ -66,28 +49,6 @@ def main():
     return final_clusters
 
 
-# Function for post-clustering by isomorphism (same as before)
-def postcluster_by_isomorphism(data, bond_clusters):
-    final_clusters = []
-
-    for group in bond_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-
-    return final_clusters
-
-
 # Node and edge match functions for isomorphism
 def node_match(n1, n2):
     return n1['charge'] == n2['charge'] and n1['element'] == n2['element']
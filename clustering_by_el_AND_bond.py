@@ -113,9 +113,10 @@ final_clusters = main()
 
 # erst element, dann bond clustering
 import pickle
-import networkx as nx
 import time
-from collections import Counter
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
+from composition_fingerprints import cluster_by_composition, subcluster_by_composition
 
 # Load data
 with open('reaction_centers.pkl', 'rb') as f:
@@ -129,62 +130,13 @@ def node_match(n1, n2):
 def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
-# Function to calculate element counts
-def calculate_element_count(graph):
-    element_counts = Counter(n['element'] for _, n in graph.nodes(data=True))
-    sorted_elements = sorted(element_counts.items())
-    element_string = "".join(f"{el}{count}" for el, count in sorted_elements)
-    return element_string
-
-# Function to calculate bond order counts
-def calculate_bond_order_counts(graph):
-    bond_orders = [e[2]['order'] for e in graph.edges(data=True)]
-    bond_order_counts = Counter(bond_orders)
-    sorted_bond_orders = sorted(bond_order_counts.items())
-    bond_order_string = "".join(f"{order}:{count}" for order, count in sorted_bond_orders)
-    return bond_order_string
-
-# Step 1: Cluster by element counts
+# Step 1: Cluster by element counts (vectorized element count vectors instead of "C3H2O1" strings)
 def cluster_by_element_counts(data):
-    clusters = {}
-    for i, rc in enumerate(data):
-        element_string = calculate_element_count(rc['reaction_center'])
-        if element_string not in clusters:
-            clusters[element_string] = []
-        clusters[element_string].append(i)
-    return list(clusters.values())
+    return cluster_by_composition(data, ('elements',))
 
-# Step 2: Subcluster each element-based cluster by bond order counts
+# Step 2: Subcluster each element-based cluster by bond order counts (count vectors over interned order tuples)
 def subcluster_by_bond_order_counts(data, element_clusters):
-    final_clusters = []
-    for group in element_clusters:
-        bond_clusters = {}
-        for idx in group:
-            bond_order_string = calculate_bond_order_counts(data[idx]['reaction_center'])
-            if bond_order_string not in bond_clusters:
-                bond_clusters[bond_order_string] = []
-            bond_clusters[bond_order_string].append(idx)
-        final_clusters.extend(list(bond_clusters.values()))
-    return final_clusters
-
-# Step 3: Post-cluster by isomorphism
-def postcluster_by_isomorphism(data, bond_clusters):
-    final_clusters = []
-    for group in bond_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
+    return subcluster_by_composition(data, element_clusters, ('orders',))
 
 # Main function
 def main():
@@ -201,9 +153,13 @@ def main():
     end_bond_clustering = time.time()
 
     # Step 3: Post-cluster by isomorphism
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     start_isomorphism_clustering = time.time()
-    final_clusters = postcluster_by_isomorphism(data, bond_clusters)
+    final_clusters = postcluster_by_isomorphism(data, bond_clusters, verdict_cache, call_log, node_match, edge_match)
     end_isomorphism_clustering = time.time()
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Timing results
     print(f"Time for clustering by element counts: {end_element_clustering - start_element_clustering:.2f} seconds")
@@ -1,5 +1,6 @@
 import pickle
 import networkx as nx
+from wl_hashing import wl_fingerprints
 
 with open('Small_RCs_khop_2.pkl', 'rb') as f:
     data = pickle.load(f)
@@ -20,9 +21,15 @@ def edge_match(e1, e2):
 def cluster_reaction_centers(data):
     clusters = []  # List of groups, each group is a list of indices or RCs
 
+    # Isomorphic RCs always have the same WL fingerprint, so an RC only has to be compared
+    # to the groups in its own fingerprint bucket (groups are still numbered in creation order)
+    fingerprints = wl_fingerprints(data, iterations=3).tolist()
+    bucket_groups = {}
+
     for i, rc in enumerate(data):
+        groups = bucket_groups.setdefault(fingerprints[i], [])
         is_added = False
-        for group in clusters:
+        for group in groups:
             # Compare the RC to the first RC in the group
             representative_rc = data[group[0]]['reaction_center']
             if nx.is_isomorphic(rc['reaction_center'], representative_rc, node_match=node_match, edge_match=edge_match):
@@ -32,7 +39,8 @@ def cluster_reaction_centers(data):
 
         # If no group matches, create a new group
         if not is_added:
-            clusters.append([i])
+            groups.append([i])
+            clusters.append(groups[-1])
 
     return clusters
 
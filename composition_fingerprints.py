@@ -0,0 +1,98 @@
+import pickle
+import time
+
+import numpy as np
+
+from wl_csr_engine import compress_key, dense_row_ids
+
+# Parts of a composition fingerprint: element counts (charge ignored, like calculate_element_count),
+# element/charge counts (the node labels used by node_match) and bond order counts
+COMPOSITION_PARTS = ('elements', 'element_charges', 'orders')
+
+
+# Function to intern the elements, (element, charge) pairs and bond orders of all reaction centers into small ids
+# in one flat pass (nodes or edges can be skipped if no requested part needs them, iterating the edges dominates)
+def intern_labels(data, element_table=None, element_charge_table=None, order_table=None, nodes=True, edges=True):
+    element_table = {} if element_table is None else element_table
+    element_charge_table = {} if element_charge_table is None else element_charge_table
+    order_table = {} if order_table is None else order_table
+    node_graph, elements, element_charges = [], [], []
+    edge_graph, orders = [], []
+    for i, rc in enumerate(data):
+        graph = rc['reaction_center']
+        if nodes:
+            for _, attrs in graph.nodes(data=True):
+                node_graph.append(i)
+                elements.append(compress_key(attrs['element'], element_table))
+                element_charges.append(compress_key((attrs['element'], attrs['charge']), element_charge_table))
+        if edges:
+            for _, _, attrs in graph.edges(data=True):
+                edge_graph.append(i)
+                orders.append(compress_key(attrs['order'], order_table))
+    return {
+        'num_graphs': len(data),
+        'node_graph': np.array(node_graph, dtype=np.int64),
+        'elements': np.array(elements, dtype=np.int64),
+        'element_charges': np.array(element_charges, dtype=np.int64),
+        'edge_graph': np.array(edge_graph, dtype=np.int64),
+        'orders': np.array(orders, dtype=np.int64),
+        'tables': {'elements': element_table, 'element_charges': element_charge_table, 'orders': order_table},
+    }
+
+
+# Function to count the ids of every graph into a fixed-width (num_graphs, num_ids) matrix with one bincount
+def count_matrix(graph_ids, ids, num_graphs, num_ids):
+    # At least one column, so graphs without any nodes or edges still get a (zero) count row
+    num_ids = max(num_ids, 1)
+    counts = np.bincount(graph_ids * num_ids + ids, minlength=num_graphs * num_ids)
+    return counts.reshape(num_graphs, num_ids)
+
+
+# Function to compute the requested composition count matrices of all reaction centers
+def composition_counts(data, parts=COMPOSITION_PARTS):
+    labels = intern_labels(data, nodes=any(part != 'orders' for part in parts), edges='orders' in parts)
+    # Only pairs that occur get a column, so the width is the number of distinct labels of each part
+    graph_ids = {'elements': labels['node_graph'], 'element_charges': labels['node_graph'],
+                 'orders': labels['edge_graph']}
+    return {part: count_matrix(graph_ids[part], labels[part], labels['num_graphs'], len(labels['tables'][part]))
+            for part in parts}
+
+
+# Function to assign exact composition ids (graphs get equal ids exactly if all selected count vectors are equal)
+def composition_ids(data, parts=('elements',)):
+    counts = composition_counts(data, parts)
+    return dense_row_ids(np.hstack([counts[part] for part in parts])).tolist()
+
+
+# Function to group indices by their composition ids (groups keep the order of their first member)
+def cluster_by_composition(data, parts=('elements',)):
+    clusters = {}
+    for i, key in enumerate(composition_ids(data, parts)):
+        clusters.setdefault(key, []).append(i)
+    return list(clusters.values())
+
+
+# Function to split every cluster by composition ids (the ids are computed in one pass for all graphs to refine)
+def subcluster_by_composition(data, clusters, parts=('orders',)):
+    indices = [idx for cluster in clusters for idx in cluster]
+    keys = dict(zip(indices, composition_ids([data[idx] for idx in indices], parts)))
+    final_clusters = []
+    for cluster in clusters:
+        sub_clusters = {}
+        for idx in cluster:
+            sub_clusters.setdefault(keys[idx], []).append(idx)
+        final_clusters.extend(sub_clusters.values())
+    return final_clusters
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('reaction_centers.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    for parts in (('elements',), ('orders',), COMPOSITION_PARTS):
+        start = time.time()
+        clusters = cluster_by_composition(data, parts)
+        end = time.time()
+        print(f"Time for {' + '.join(parts)}: {end - start:.2f}s, clusters = {len(clusters)}")
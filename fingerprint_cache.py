@@ -0,0 +1,44 @@
+import hashlib
+import os
+import pickle
+
+import networkx as nx
+
+# Default location of the on-disk WL fingerprint cache shared by all scripts
+FINGERPRINT_CACHE_FILE = 'wl_fingerprint_cache.pkl'
+
+
+# Function to compute a stable content digest of a reaction center (nodes, element, charge, edges, order)
+def graph_content_digest(graph):
+    nodes = sorted(
+        (repr(node), repr(attrs['element']), repr(attrs['charge']))
+        for node, attrs in graph.nodes(data=True)
+    )
+    edges = sorted(
+        tuple(sorted((repr(u), repr(v)))) + (repr(attrs['order']),)
+        for u, v, attrs in graph.edges(data=True)
+    )
+    return hashlib.blake2b(repr((nodes, edges)).encode(), digest_size=16).hexdigest()
+
+
+# Function to build the cache key of a graph for a given set of WL parameters
+def fingerprint_key(graph, **wl_params):
+    # The networkx version is part of the key because the WL hash implementation may change between releases
+    return graph_content_digest(graph), nx.__version__, tuple(sorted(wl_params.items()))
+
+
+# Function to load the fingerprint cache from disk (empty cache if the file does not exist yet)
+def load_fingerprint_cache(filename=FINGERPRINT_CACHE_FILE):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+# Function to save the fingerprint cache to disk
+def save_fingerprint_cache(cache, filename=FINGERPRINT_CACHE_FILE):
+    # Write to a temporary file first so that an interrupted run never leaves a broken cache behind
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as f:
+        pickle.dump(cache, f)
+    os.replace(temp_filename, filename)
@@ -0,0 +1,184 @@
+import pickle
+import time
+
+from wl_csr_engine import compress_key, recursive_wl_clustering_union
+
+# Entry of the dense adjacency matrix for "no edge"
+NO_EDGE = -1
+
+
+# Function to compile a reaction center into integer node colors and a dense matrix of edge order codes
+# (the tables are shared by all graphs of a dataset, so equal codes mean equal labels in every graph)
+def compile_graph(graph, node_color_table, edge_order_table, refinement_table=None):
+    nodes = list(graph.nodes())
+    node_index = {node: i for i, node in enumerate(nodes)}
+    num_nodes = len(nodes)
+
+    colors = [compress_key((attrs['element'], attrs['charge']), node_color_table) for _, attrs in graph.nodes(data=True)]
+    adjacency = [[NO_EDGE] * num_nodes for _ in range(num_nodes)]
+    neighbors = [[] for _ in range(num_nodes)]
+    for u, v, attrs in graph.edges(data=True):
+        i, j = node_index[u], node_index[v]
+        order = compress_key(attrs['order'], edge_order_table)
+        adjacency[i][j] = order
+        adjacency[j][i] = order
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+
+    # With a refinement table the colors are the stable WL colors, so only nodes WL cannot tell apart are paired
+    if refinement_table is not None:
+        colors = refine_node_colors(colors, neighbors, adjacency, refinement_table)
+
+    degrees = [len(node_neighbors) for node_neighbors in neighbors]
+    return {
+        'colors': colors,
+        'adjacency': adjacency,
+        'neighbors': neighbors,
+        'degrees': degrees,
+        'num_edges': graph.number_of_edges(),
+        # Multiset of (color, degree, incident order codes) per node, used to reject non-isomorphic pairs early
+        'signature': sorted((colors[i], degrees[i], tuple(sorted(adjacency[i][j] for j in neighbors[i])))
+                            for i in range(num_nodes)),
+        'matching_order': matching_order(colors, neighbors),
+    }
+
+
+# Function to compile the given reaction centers (all by default) with shared color and order tables
+# (returns a dict from index to compiled graph, so only graphs that are actually compared need to be compiled)
+def compile_dataset(data, indices=None, wl_refine=True):
+    node_color_table = {}
+    edge_order_table = {}
+    refinement_table = {} if wl_refine else None
+    if indices is None:
+        indices = range(len(data))
+    return {idx: compile_graph(data[idx]['reaction_center'], node_color_table, edge_order_table, refinement_table)
+            for idx in indices}
+
+
+# Function to refine node colors WITH edge orders until the partition is stable
+# (the round is part of the key and isomorphic graphs stabilize in the same round, so they get equal colors)
+def refine_node_colors(colors, neighbors, adjacency, refinement_table):
+    num_colors = len(set(colors))
+    round_idx = 0
+    while True:
+        round_idx += 1
+        new_colors = []
+        for i in range(len(colors)):
+            neighbor_colors = tuple(sorted((colors[j], adjacency[i][j]) for j in neighbors[i]))
+            new_colors.append(compress_key((round_idx, colors[i], neighbor_colors), refinement_table))
+        num_new_colors = len(set(new_colors))
+        if num_new_colors == num_colors:
+            return new_colors
+        colors = new_colors
+        num_colors = num_new_colors
+
+
+# Function to fix the order in which nodes are matched (rarest color first, then always a node
+# with the most already ordered neighbors, so candidates are constrained as early as possible)
+def matching_order(colors, neighbors):
+    num_nodes = len(colors)
+    color_counts = {}
+    for color in colors:
+        color_counts[color] = color_counts.get(color, 0) + 1
+
+    order = []
+    ordered = [False] * num_nodes
+    connections = [0] * num_nodes
+    while len(order) < num_nodes:
+        node = min((i for i in range(num_nodes) if not ordered[i]),
+                   key=lambda i: (-connections[i], color_counts[colors[i]], -len(neighbors[i]), i))
+        order.append(node)
+        ordered[node] = True
+        for neighbor in neighbors[node]:
+            connections[neighbor] += 1
+    return order
+
+
+# Function to test two compiled graphs for isomorphism (only integer comparisons, no attribute callbacks)
+def is_isomorphic_compiled(compiled1, compiled2):
+    if compiled1['num_edges'] != compiled2['num_edges'] or compiled1['signature'] != compiled2['signature']:
+        return False
+
+    order = compiled1['matching_order']
+    mapping = [NO_EDGE] * len(order)
+    used = [False] * len(order)
+    return extend_mapping(compiled1, compiled2, order, 0, mapping, used)
+
+
+# Function to extend a partial mapping by the next node of the matching order (backtracking)
+def extend_mapping(compiled1, compiled2, order, depth, mapping, used):
+    if depth == len(order):
+        return True
+
+    node = order[depth]
+    color = compiled1['colors'][node]
+    degree = compiled1['degrees'][node]
+    adjacency1 = compiled1['adjacency'][node]
+    colors2, degrees2, adjacency2 = compiled2['colors'], compiled2['degrees'], compiled2['adjacency']
+
+    # A node with an already mapped neighbor can only go to a neighbor of that neighbor's image
+    candidates = range(len(order))
+    for neighbor in compiled1['neighbors'][node]:
+        if mapping[neighbor] != NO_EDGE:
+            candidates = compiled2['neighbors'][mapping[neighbor]]
+            break
+
+    for candidate in candidates:
+        if used[candidate] or colors2[candidate] != color or degrees2[candidate] != degree:
+            continue
+        # Edges and non-edges to all mapped nodes must agree, including the order codes
+        candidate_adjacency = adjacency2[candidate]
+        if any(adjacency1[order[i]] != candidate_adjacency[mapping[order[i]]] for i in range(depth)):
+            continue
+        mapping[node] = candidate
+        used[candidate] = True
+        if extend_mapping(compiled1, compiled2, order, depth + 1, mapping, used):
+            return True
+        mapping[node] = NO_EDGE
+        used[candidate] = False
+    return False
+
+
+# Function to post-cluster by isomorphism with the compiled matcher (drop-in for postcluster_by_isomorphism)
+def postcluster_by_compiled_isomorphism(data, invariant_clusters, compiled_graphs=None):
+    # Only graphs of non-singleton groups are ever compared, each is compiled once and reused in all its comparisons
+    if compiled_graphs is None:
+        compared = [idx for group in invariant_clusters if len(group) > 1 for idx in group]
+        compiled_graphs = compile_dataset(data, compared)
+    final_clusters = []
+    for group in invariant_clusters:
+        sub_clusters = []
+        for idx in group:
+            is_added = False
+            for sub_cluster in sub_clusters:
+                if is_isomorphic_compiled(compiled_graphs[idx], compiled_graphs[sub_cluster[0]]):
+                    sub_cluster.append(idx)
+                    is_added = True
+                    break
+            if not is_added:
+                sub_clusters.append([idx])
+        final_clusters.extend(sub_clusters)
+    return final_clusters
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Small_RCs_khop_2.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    wl_start = time.time()
+    final_clusters = recursive_wl_clustering_union(data, verbose=False)
+    wl_end = time.time()
+    wl_time = wl_end - wl_start
+    print(f"Time for WL-Implementation: {wl_time:.2f}s")
+
+    iso_start = time.time()
+    post_iso_clusters = postcluster_by_compiled_isomorphism(data, final_clusters)
+    iso_end = time.time()
+    iso_time = iso_end - iso_start
+    print(f"Time for Post Clustering with compiled matcher: {iso_time:.2f}s")
+
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")
+    print(f"Final number of clusters after compiled Isomorphism Test: {len(post_iso_clusters)}")
+    print(f"Time in total: {wl_time + iso_time:.2f}s")
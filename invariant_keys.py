@@ -0,0 +1,28 @@
+# Number of decimals float invariants (density, average shortest path, ...) are rounded to before grouping,
+# so values that only differ by floating point noise end up in the same group
+INVARIANT_DECIMALS = 9
+
+
+# Function to turn an invariant value into a hashable, tolerance-aware key
+# (floats are rounded, lists/tuples become tuples, dicts become sorted tuples of items)
+def hashable_invariant(value, decimals=INVARIANT_DECIMALS):
+    if isinstance(value, float):
+        return round(value, decimals)
+    if isinstance(value, dict):
+        return tuple(sorted((key, hashable_invariant(item, decimals)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable_invariant(item, decimals) for item in value)
+    return value
+
+
+# Function to compute the invariant keys of all reaction centers with a given invariant function
+def compute_invariant_keys(data, calculate_invariants, decimals=INVARIANT_DECIMALS):
+    return [hashable_invariant(calculate_invariants(rc['reaction_center']), decimals) for rc in data]
+
+
+# Function to group indices by their keys in a single pass (groups keep the order of their first member)
+def group_by_keys(invariant_keys):
+    groups = {}
+    for i, key in enumerate(invariant_keys):
+        groups.setdefault(key, []).append(i)
+    return list(groups.values()), list(groups)
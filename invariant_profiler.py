@@ -0,0 +1,162 @@
+import itertools
+import pickle
+import random
+import time
+from collections import OrderedDict
+
+import networkx as nx
+
+from canonical_form import canonical_certificate
+from cascade_planner import PLANNER_SAMPLE_SIZE, sample_dataset
+from invariant_keys import group_by_keys, hashable_invariant
+from verdict_cache import cached_is_isomorphic, graph_keys_of
+
+# Number of sampled comparisons timed to estimate the cost of one comparison
+TIMED_COMPARISONS = 200
+
+
+# Node match function
+def node_match(n1, n2):
+    return n1['charge'] == n2['charge'] and n1['element'] == n2['element']
+
+# Edge match function
+def edge_match(e1, e2):
+    return e1['order'] == e2['order']
+
+
+# Function to calculate the sorted Katz centralities (None if the power iteration does not converge)
+def katz_values(graph):
+    try:
+        return sorted(nx.katz_centrality(graph).values())
+    except nx.PowerIterationFailedConvergence:
+        return None
+
+
+# Candidate invariants of invariants_clustering.py and Invariants_vergl.py
+# (centralities are compared as sorted value lists, a dict keyed by node would depend on the node numbering)
+CANDIDATE_INVARIANTS = {
+    'vertex_count': lambda graph: graph.number_of_nodes(),
+    'edge_count': lambda graph: graph.number_of_edges(),
+    'degrees': lambda graph: sorted(dict(graph.degree()).values()),
+    'density': nx.density,
+    'triangles': lambda graph: sum(nx.triangles(graph).values()),
+    'node_connectivity': nx.node_connectivity,
+    'avg_shortest_path': lambda graph: nx.average_shortest_path_length(graph) if nx.is_connected(graph) else None,
+    'planarity': nx.is_planar,
+    'degree_centrality': lambda graph: sorted(nx.degree_centrality(graph).values()),
+    'katz': katz_values,
+}
+
+
+# Function to measure an invariant on the sample (compute time per graph and the hashable key of every graph)
+def measure_invariant(invariant, sample):
+    start = time.time()
+    values = [invariant(rc['reaction_center']) for rc in sample]
+    end = time.time()
+    return {'cost_per_graph': (end - start) / len(sample), 'keys': [hashable_invariant(value) for value in values]}
+
+
+# Function to list the comparisons the post-clustering of verdict_cache.py makes on a partition
+# (every graph is compared to the representatives of the sub-clusters of its group until one matches,
+# the most recently matched sub-cluster first)
+def postclustering_comparisons(clusters, classes):
+    comparisons = []
+    for group in clusters:
+        recent_representatives = []
+        for idx in group:
+            for position, (class_id, representative) in enumerate(recent_representatives):
+                comparisons.append((idx, representative))
+                if class_id == classes[idx]:
+                    recent_representatives.insert(0, recent_representatives.pop(position))
+                    break
+            else:
+                recent_representatives.insert(0, (classes[idx], idx))
+    return comparisons
+
+
+# Function to measure the average time of one comparison on a random subset of the given comparisons
+# (timed through cached_is_isomorphic with an empty verdict cache, so exact signature rejects are included,
+# graph_keys holds the digests and signatures of the sample, they are computed once per graph and not per comparison)
+def measure_comparison_cost(sample, comparisons, graph_keys, num_timed=TIMED_COMPARISONS, seed=0):
+    if not comparisons:
+        return 0.0
+    timed = random.Random(seed).sample(comparisons, min(num_timed, len(comparisons)))
+    verdict_cache = OrderedDict()
+    start = time.time()
+    for idx1, idx2 in timed:
+        cached_is_isomorphic(sample, idx1, idx2, graph_keys, verdict_cache, node_match, edge_match)
+    end = time.time()
+    return (end - start) / len(timed)
+
+
+# Function to profile every combination of invariants and recommend the one with the lowest expected runtime
+# (invariant time and matching comparisons scale with 1/fraction, every graph matches at most once,
+# rejected comparisons scale with 1/fraction^2 as the pairs in cascade_planner.py)
+def profile_invariants(data, invariants=None, sample_size=PLANNER_SAMPLE_SIZE, seed=0, verbose=True):
+    if invariants is None:
+        invariants = CANDIDATE_INVARIANTS
+    sample = sample_dataset(data, sample_size, seed)
+    fraction = len(sample) / len(data)
+    names = list(invariants)
+    measurements = {name: measure_invariant(invariants[name], sample) for name in names}
+
+    # The true isomorphism classes of the sample tell which comparisons end in a match
+    classes = [canonical_certificate(rc['reaction_center']) for rc in sample]
+    graph_keys = {}
+    for idx in range(len(sample)):
+        graph_keys_of(sample, idx, graph_keys)
+
+    # Comparisons the invariants leave are harder than the ones the exact signatures reject, so the cost per
+    # comparison is timed on the comparisons of every distinct partition (matches and rejects separately,
+    # a random subset of all comparisons would hardly contain any of the expensive matches)
+    comparison_costs = {}
+    profiles = []
+    for num_invariants in range(len(names) + 1):
+        for combination in itertools.combinations(names, num_invariants):
+            keys = list(zip(*(measurements[name]['keys'] for name in combination))) or [()] * len(sample)
+            clusters, _ = group_by_keys(keys)
+            comparisons = postclustering_comparisons(clusters, classes)
+            matches = [(idx1, idx2) for idx1, idx2 in comparisons if classes[idx1] == classes[idx2]]
+            rejects = [(idx1, idx2) for idx1, idx2 in comparisons if classes[idx1] != classes[idx2]]
+            partition = tuple(tuple(cluster) for cluster in clusters)
+            if partition not in comparison_costs:
+                comparison_costs[partition] = (measure_comparison_cost(sample, matches, graph_keys, seed=seed),
+                                               measure_comparison_cost(sample, rejects, graph_keys, seed=seed))
+            match_cost, reject_cost = comparison_costs[partition]
+            invariant_time = sum(measurements[name]['cost_per_graph'] for name in combination) * len(data)
+            num_comparisons = len(matches) / fraction + len(rejects) / fraction ** 2
+            comparison_time = len(matches) * match_cost / fraction + len(rejects) * reject_cost / fraction ** 2
+            profiles.append({
+                'invariants': combination,
+                'groups': len(clusters),
+                'comparisons': num_comparisons,
+                'cost_per_comparison': comparison_time / num_comparisons if num_comparisons else 0.0,
+                'invariant_time': invariant_time,
+                'comparison_time': comparison_time,
+                'expected_time': invariant_time + comparison_time,
+            })
+    # Fewer invariants win ties
+    profiles.sort(key=lambda profile: (profile['expected_time'], len(profile['invariants'])))
+
+    if verbose:
+        for name in names:
+            print(f"{name}: {measurements[name]['cost_per_graph'] * 1e6:.1f} us per graph")
+        for profile in profiles[:10]:
+            print(f"{', '.join(profile['invariants']) or '(none)'}: groups in sample = {profile['groups']}, "
+                  f"expected comparisons = {profile['comparisons']:.0f} "
+                  f"({profile['cost_per_comparison'] * 1e6:.1f} us each), "
+                  f"expected time = {profile['expected_time']:.2f}s")
+        print(f"Recommended invariants: {', '.join(profiles[0]['invariants']) or '(none)'}")
+    return profiles
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('reaction_centers.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    start = time.time()
+    profiles = profile_invariants(data)
+    end = time.time()
+    print(f"Time for profiling: {end - start:.2f}s")
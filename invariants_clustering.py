@@ -1,5 +1,6 @@
 import pickle
 import networkx as nx
+from invariant_keys import compute_invariant_keys, group_by_keys
 
 # Laden der Daten
 with open('reaction_centers.pkl', 'rb') as f:
@@ -33,55 +34,36 @@ def calculate_invariants(graph):
     )
 
 
-# Funktion zur Gruppierung nach Invarianten
-def cluster_by_invariants(data):
-    clusters = []  # Liste der Gruppen
-    invariants_per_group = []  # Liste der Invarianten für jede Gruppe
-
-    for i, rc in enumerate(data):
-        invariants = calculate_invariants(rc['reaction_center'])  # Invarianten berechnen
-        is_added = False
-
-        # Vergleiche mit jeder bestehenden Gruppe
-        for group_idx, group_invariants in enumerate(invariants_per_group):
-            if invariants == group_invariants:  # Gleiche Invarianten
-                clusters[group_idx].append(i)  # Füge zur Gruppe hinzu
-                is_added = True
-                break
-
-        # Falls keine passende Gruppe gefunden, neue Gruppe erstellen
-        if not is_added:
-            clusters.append([i])
-            invariants_per_group.append(invariants)
-
+# Funktion zur Gruppierung nach Invarianten (ein Durchlauf über ein Dict mit gerundeten, hashbaren Schlüsseln)
+def cluster_by_invariants(data, invariant_keys=None):
+    if invariant_keys is None:
+        invariant_keys = compute_invariant_keys(data, calculate_invariants)  # Invarianten berechnen
+    clusters, invariants_per_group = group_by_keys(invariant_keys)
     return clusters, invariants_per_group
 
 
-def analyze_invariants_divisions(data):
+def analyze_invariants_divisions(data, invariant_keys=None):
     unique_values_per_invariant = {}
 
-    # Calculate all invariants for each RC
-    all_invariants = [calculate_invariants(rc['reaction_center']) for rc in data]
+    # Reuse the keys of the grouping if available (they are already hashable), otherwise calculate them
+    if invariant_keys is None:
+        invariant_keys = compute_invariant_keys(data, calculate_invariants)
 
     # For each invariant position (e.g., Vertex Count, Edge Count)
-    for i in range(len(all_invariants[0])):
-        # Convert mutable objects (like dicts) to hashable objects
-        unique_values = set(
-            tuple(invariant[i].items()) if isinstance(invariant[i], dict) else
-            tuple(invariant[i]) if isinstance(invariant[i], list) else
-            invariant[i]
-            for invariant in all_invariants
-        )
-        unique_values_per_invariant[i] = len(unique_values)
+    for i in range(len(invariant_keys[0])):
+        unique_values_per_invariant[i] = len(set(key[i] for key in invariant_keys))
 
     return unique_values_per_invariant
 
 
+# Calculate the invariant keys once for both the grouping and the analysis
+invariant_keys = compute_invariant_keys(data, calculate_invariants)
+
 # Group RCs by invariants
-clusters, invariants_per_group = cluster_by_invariants(data)
+clusters, invariants_per_group = cluster_by_invariants(data, invariant_keys)
 
 # Analyze divisions created by each invariant
-invariant_divisions = analyze_invariants_divisions(data)
+invariant_divisions = analyze_invariants_divisions(data, invariant_keys)
 
 
 # Ergebnisse ausgeben
@@ -0,0 +1,128 @@
+import os
+import pickle
+import time
+
+from networkx.algorithms.isomorphism import GraphMatcher
+
+from canonical_form import CanonicalSearchBudgetExceeded, canonical_certificate
+
+# Wall time in seconds after which a VF2 call is aborted and escalated to canonical labeling
+ISOMORPHISM_TIME_BUDGET = 1.0
+# Number of VF2 states between two checks of the clock
+BUDGET_CHECK_INTERVAL = 256
+# Wall time in seconds an escalated pair may take before it is left unresolved
+ESCALATION_TIME_BUDGET = 10.0
+# Default file for the slow pairs of a run
+SLOW_PAIRS_FILE = 'slow_isomorphism_pairs.pkl'
+# Match semantics canonical certificates implement (element and charge of the nodes, order of the edges)
+CANONICAL_MATCH_SEMANTICS = ('element', 'charge', 'order')
+
+
+# Raised by the counting matcher when a call runs out of its time budget
+class IsomorphismBudgetExceeded(Exception):
+    pass
+
+
+# VF2 matcher that counts the visited states and stops once the time budget is used up
+# (optional node colors, e.g. stable WL colors, restrict the candidate pairs to nodes of equal color)
+class BudgetedGraphMatcher(GraphMatcher):
+    def __init__(self, graph1, graph2, node_match, edge_match, time_budget, node_colors=None):
+        super().__init__(graph1, graph2, node_match=node_match, edge_match=edge_match)
+        self.time_budget = time_budget
+        self.node_colors = node_colors
+        self.start_time = time.perf_counter()
+        self.num_states = 0
+
+    def syntactic_feasibility(self, G1_node, G2_node):
+        self.num_states += 1
+        if self.num_states % BUDGET_CHECK_INTERVAL == 0 and time.perf_counter() - self.start_time > self.time_budget:
+            raise IsomorphismBudgetExceeded()
+        if self.node_colors is not None and self.node_colors[0][G1_node] != self.node_colors[1][G2_node]:
+            return False
+        return super().syntactic_feasibility(G1_node, G2_node)
+
+
+# Function to create the call log of a run (totals, wall time and VF2 states of every call, and the pairs
+# that exceeded the budget)
+def new_call_log(time_budget=ISOMORPHISM_TIME_BUDGET, escalation_budget=ESCALATION_TIME_BUDGET):
+    return {'time_budget': time_budget, 'escalation_budget': escalation_budget, 'calls': 0, 'time': 0.0,
+            'states': 0, 'max_time': 0.0, 'call_times': [], 'call_states': [], 'slow_pairs': [], 'unresolved': 0}
+
+
+# Function to decide a pair that exceeded the budget under its own escalation budget (None if that runs out too)
+# (canonical certificates only implement the default semantics, any other node_match/edge_match is honored
+# by continuing the VF2 search)
+def escalate_pair(graph1, graph2, node_match, edge_match, match_semantics, node_colors=None,
+                  escalation_budget=ESCALATION_TIME_BUDGET):
+    start = time.perf_counter()
+    try:
+        if match_semantics == CANONICAL_MATCH_SEMANTICS:
+            certificate1 = canonical_certificate(graph1, escalation_budget)
+            remaining_budget = max(escalation_budget - (time.perf_counter() - start), 0.0)
+            return certificate1 == canonical_certificate(graph2, remaining_budget)
+        return BudgetedGraphMatcher(graph1, graph2, node_match, edge_match, escalation_budget,
+                                    node_colors).is_isomorphic()
+    except (CanonicalSearchBudgetExceeded, IsomorphismBudgetExceeded):
+        return None
+
+
+# Function to test two reaction centers for isomorphism with VF2 under a time budget
+# (match_semantics names what node_match/edge_match compare, pairs over the budget are escalated by escalate_pair,
+# unresolved pairs return None and are treated as not isomorphic by the callers)
+def budgeted_is_isomorphic(graph1, graph2, node_match, edge_match, call_log=None, node_colors=None,
+                           match_semantics=CANONICAL_MATCH_SEMANTICS):
+    time_budget = call_log['time_budget'] if call_log is not None else ISOMORPHISM_TIME_BUDGET
+    escalation_budget = call_log['escalation_budget'] if call_log is not None else ESCALATION_TIME_BUDGET
+    matcher = BudgetedGraphMatcher(graph1, graph2, node_match, edge_match, time_budget, node_colors)
+    escalated = False
+    try:
+        verdict = matcher.is_isomorphic()
+    except IsomorphismBudgetExceeded:
+        escalated = True
+        verdict = escalate_pair(graph1, graph2, node_match, edge_match, match_semantics, node_colors,
+                                escalation_budget)
+    elapsed = time.perf_counter() - matcher.start_time
+
+    if call_log is not None:
+        call_log['calls'] += 1
+        call_log['time'] += elapsed
+        call_log['states'] += matcher.num_states
+        call_log['max_time'] = max(call_log['max_time'], elapsed)
+        call_log['call_times'].append(elapsed)
+        call_log['call_states'].append(matcher.num_states)
+        if verdict is None:
+            call_log['unresolved'] += 1
+        if escalated:
+            call_log['slow_pairs'].append({
+                'graphs': (graph1, graph2),
+                'states': matcher.num_states,
+                'time': elapsed,
+                'verdict': verdict,
+            })
+    return verdict
+
+
+# Function to save the slow pairs of a run for offline analysis
+def save_slow_pairs(slow_pairs, filename=SLOW_PAIRS_FILE):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as f:
+        pickle.dump(slow_pairs, f)
+    os.replace(temp_filename, filename)
+
+
+# Function to print the call log summary and dump the slow pairs (if there are any)
+def report_call_log(call_log, filename=SLOW_PAIRS_FILE):
+    print(f"VF2 calls: {call_log['calls']}, states: {call_log['states']}, time: {call_log['time']:.2f}s, "
+          f"slowest call: {call_log['max_time']:.2f}s")
+    if call_log['calls']:
+        call_times = sorted(call_log['call_times'])
+        print(f"VF2 call time median: {call_times[len(call_times) // 2] * 1e3:.2f}ms, "
+              f"99th percentile: {call_times[int(len(call_times) * 0.99)] * 1e3:.2f}ms, "
+              f"most states in one call: {max(call_log['call_states'])}")
+    if call_log['slow_pairs']:
+        save_slow_pairs(call_log['slow_pairs'], filename)
+        print(f"{len(call_log['slow_pairs'])} pairs exceeded the budget of {call_log['time_budget']:.2f}s "
+              f"and were escalated, saved to {filename}")
+    if call_log['unresolved']:
+        print(f"{call_log['unresolved']} escalated pairs also exceeded the escalation budget of "
+              f"{call_log['escalation_budget']:.2f}s and were left unresolved (verdict None)")
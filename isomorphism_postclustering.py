@@ -1,6 +1,8 @@
 import pickle
-import networkx as nx
 import time
+from invariant_keys import compute_invariant_keys, group_by_keys
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 
 # Load data
 with open('reaction_centers.pkl', 'rb') as f:
@@ -21,46 +23,11 @@ def calculate_invariants(graph):
     #avg_shortest_path = nx.average_shortest_path_length(graph) if nx.is_connected(graph) else None
     return (degrees)    #, density, avg_shortest_path)
 
-# Function to cluster by invariants
+# Function to cluster by invariants (single dict pass over hashable, rounded invariant keys)
 def cluster_by_invariants(data):
-    clusters = []
-    invariants_per_group = []
-
-    for i, rc in enumerate(data):
-        invariants = calculate_invariants(rc['reaction_center'])
-        is_added = False
-        for group_idx, group_invariants in enumerate(invariants_per_group):
-            if invariants == group_invariants:
-                clusters[group_idx].append(i)
-                is_added = True
-                break
-        if not is_added:
-            clusters.append([i])
-            invariants_per_group.append(invariants)
-
+    clusters, _ = group_by_keys(compute_invariant_keys(data, calculate_invariants))
     return clusters
 
-# Function to post-cluster by isomorphism within each invariant group
-def postcluster_by_isomorphism(data, invariant_clusters):
-    final_clusters = []
-
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-
-    return final_clusters
-
 # Main function to combine both clustering methods and measure time
 def main():
     # Step 1: Measure time for clustering by invariants
@@ -69,9 +36,13 @@ def main():
     end_invariants = time.time()
 
     # Step 2: Measure time for post-clustering by isomorphism
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     start_isomorphism = time.time()
-    final_clusters = postcluster_by_isomorphism(data, invariant_clusters)
+    final_clusters = postcluster_by_isomorphism(data, invariant_clusters, verdict_cache, call_log, node_match, edge_match)
     end_isomorphism = time.time()
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Total time
     total_time = (end_invariants - start_invariants) + (end_isomorphism - start_isomorphism)
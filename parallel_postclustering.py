@@ -0,0 +1,92 @@
+import os
+import pickle
+import time
+from multiprocessing import Pool
+
+from integer_matcher import postcluster_by_compiled_isomorphism
+from wl_csr_engine import recursive_wl_clustering_union
+
+# Buckets with fewer graphs than this are batched together into one task
+SMALL_BUCKET_SIZE = 16
+# Number of graphs collected in one task of small buckets
+SMALL_BATCH_GRAPHS = 256
+
+# Function to post-cluster a batch of buckets in a worker
+# (the task carries the reaction centers of its buckets, they are compiled here and not in the main process)
+def postcluster_task(task):
+    results = []
+    for bucket_idx, bucket, bucket_data in task:
+        local_clusters = postcluster_by_compiled_isomorphism(bucket_data, [list(range(len(bucket)))])
+        results.append((bucket_idx, [[bucket[i] for i in cluster] for cluster in local_clusters]))
+    return results
+
+
+# Function to build the worker tasks: large buckets alone and largest first, small buckets batched
+# (every bucket is shipped together with its reaction centers)
+def schedule_buckets(data, invariant_clusters, small_bucket_size=SMALL_BUCKET_SIZE,
+                     small_batch_graphs=SMALL_BATCH_GRAPHS):
+    # Pairwise tests grow quadratically with the bucket size, so the largest buckets have to start first
+    order = sorted(range(len(invariant_clusters)), key=lambda i: (-len(invariant_clusters[i]), i))
+    tasks = []
+    small_task = []
+    small_task_graphs = 0
+    for bucket_idx in order:
+        bucket = invariant_clusters[bucket_idx]
+        # Singletons need no test at all
+        if len(bucket) == 1:
+            continue
+        bucket_data = [data[idx] for idx in bucket]
+        if len(bucket) >= small_bucket_size:
+            tasks.append([(bucket_idx, bucket, bucket_data)])
+            continue
+        small_task.append((bucket_idx, bucket, bucket_data))
+        small_task_graphs += len(bucket)
+        if small_task_graphs >= small_batch_graphs:
+            tasks.append(small_task)
+            small_task = []
+            small_task_graphs = 0
+    if small_task:
+        tasks.append(small_task)
+    return tasks
+
+
+# Function to post-cluster all buckets by isomorphism on a process pool
+# (the result is the same as postcluster_by_isomorphism, in the same order)
+def postcluster_by_isomorphism_parallel(data, invariant_clusters, processes=None):
+    invariant_clusters = [list(group) for group in invariant_clusters]
+    tasks = schedule_buckets(data, invariant_clusters)
+
+    # Singleton buckets are already final
+    bucket_results = {bucket_idx: [bucket] for bucket_idx, bucket in enumerate(invariant_clusters) if len(bucket) == 1}
+    with Pool(processes or os.cpu_count()) as pool:
+        for task_results in pool.imap_unordered(postcluster_task, tasks):
+            bucket_results.update(task_results)
+
+    # Merge in bucket order, so the output does not depend on which worker finishes first
+    final_clusters = []
+    for bucket_idx in range(len(invariant_clusters)):
+        final_clusters.extend(bucket_results[bucket_idx])
+    return final_clusters
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Larger_rcs.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    wl_start = time.time()
+    final_clusters = recursive_wl_clustering_union(data, verbose=False)
+    wl_end = time.time()
+    wl_time = wl_end - wl_start
+    print(f"Time for WL-Implementation: {wl_time:.2f}s")
+
+    iso_start = time.time()
+    post_iso_clusters = postcluster_by_isomorphism_parallel(data, final_clusters)
+    iso_end = time.time()
+    iso_time = iso_end - iso_start
+    print(f"Time for parallel Post Clustering Isomorphism Test: {iso_time:.2f}s")
+
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")
+    print(f"Final number of clusters after Isomorphism Test: {len(post_iso_clusters)}")
+    print(f"Time in total: {wl_time + iso_time:.2f}s")
@@ -0,0 +1,96 @@
+import pickle
+import time
+
+import numpy as np
+
+from cascade import bucket_statistics, split_buckets
+from wl_csr_engine import dataset_to_csr, pack_disjoint_union
+
+# Number of decimals the eigenvalues are quantized to before they are used as bucket keys
+SPECTRAL_DECIMALS = 6
+
+# Maximum number of matrix entries stacked into one eigvalsh call (bounds the memory of large size classes)
+SPECTRAL_BATCH_ENTRIES = 1 << 24
+
+
+# Function to group the graphs of a disjoint union by their number of nodes
+def size_classes(union):
+    num_nodes = np.diff(union['graph_ptr'])
+    order = np.argsort(num_nodes, kind='stable')
+    sizes, starts = np.unique(num_nodes[order], return_index=True)
+    return dict(zip(sizes.tolist(), np.split(order, starts[1:])))
+
+
+# Function to stack the weighted adjacency or Laplacian matrices of equally sized graphs into one array
+# (element/charge codes on the diagonal, bond order codes off the diagonal, codes start at 1 so 0 means no edge)
+def stacked_matrices(union, graph_ids, size, matrix='adjacency'):
+    slots = np.full(len(union['graph_ptr']) - 1, -1, dtype=np.int64)
+    slots[graph_ids] = np.arange(len(graph_ids))
+    matrices = np.zeros((len(graph_ids), size, size), dtype=np.float64)
+
+    node_slots = slots[union['node_graph']]
+    local_nodes = np.arange(len(node_slots)) - union['graph_ptr'][union['node_graph']]
+    in_class = node_slots >= 0
+    entry_rows = union['rows']
+    entry_in_class = in_class[entry_rows]
+    rows, cols = entry_rows[entry_in_class], union['indices'][entry_in_class]
+    weights = union['edge_orders'][entry_in_class] + 1.0
+
+    if matrix == 'adjacency':
+        matrices[node_slots[rows], local_nodes[rows], local_nodes[cols]] = weights
+        diagonal = union['node_labels'] + 1.0
+    elif matrix == 'laplacian':
+        matrices[node_slots[rows], local_nodes[rows], local_nodes[cols]] = -weights
+        weighted_degrees = np.bincount(entry_rows, weights=union['edge_orders'] + 1.0, minlength=len(node_slots))
+        diagonal = weighted_degrees + union['node_labels'] + 1.0
+    else:
+        raise ValueError(f"Unknown spectral matrix '{matrix}'")
+    matrices[node_slots[in_class], local_nodes[in_class], local_nodes[in_class]] = diagonal[in_class]
+    return matrices
+
+
+# Function to compute the quantized sorted spectrum of every reaction center (one eigvalsh call per size class)
+def spectral_keys(data, matrix='adjacency', decimals=SPECTRAL_DECIMALS):
+    union = pack_disjoint_union(dataset_to_csr(data))
+    keys = [()] * len(data)
+    for size, graph_ids in size_classes(union).items():
+        if size == 0:
+            continue
+        batch_size = max(SPECTRAL_BATCH_ENTRIES // (size * size), 1)
+        for start in range(0, len(graph_ids), batch_size):
+            batch = graph_ids[start:start + batch_size]
+            # eigvalsh returns the eigenvalues of every stacked matrix in ascending order
+            eigenvalues = np.linalg.eigvalsh(stacked_matrices(union, batch, size, matrix))
+            quantized = np.rint(eigenvalues * 10 ** decimals).astype(np.int64)
+            for graph_id, spectrum in zip(batch.tolist(), quantized.tolist()):
+                keys[graph_id] = tuple(spectrum)
+    return keys
+
+
+# Function to split clusters by the spectra of their graphs (drop-in before postcluster_by_isomorphism)
+def cluster_by_spectrum(data, clusters, matrix='adjacency', decimals=SPECTRAL_DECIMALS):
+    indices = [idx for cluster in clusters if len(cluster) > 1 for idx in cluster]
+    keys = spectral_keys([data[idx] for idx in indices], matrix, decimals)
+    return split_buckets(clusters, dict(zip(indices, keys)))
+
+
+# Function to create the spectral stage of a cascade
+def spectral_stage(matrix='adjacency', decimals=SPECTRAL_DECIMALS):
+    def refine(data, buckets):
+        return cluster_by_spectrum(data, buckets, matrix, decimals)
+    return {'name': f'spectrum ({matrix})', 'refine': refine, 'cost_model': 'graphs'}
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Small_RCs_khop_2.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    for matrix in ('adjacency', 'laplacian'):
+        start = time.time()
+        clusters = cluster_by_spectrum(data, [list(range(len(data)))], matrix)
+        end = time.time()
+        stats = bucket_statistics(clusters)
+        print(f"Time for {matrix} spectra: {end - start:.2f}s, buckets = {stats['buckets']}, "
+              f"open pairs = {stats['pairs']}")
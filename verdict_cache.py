@@ -0,0 +1,124 @@
+import os
+import pickle
+from collections import Counter, OrderedDict
+
+from fingerprint_cache import graph_content_digest
+from isomorphism_budget import CANONICAL_MATCH_SEMANTICS, budgeted_is_isomorphic
+
+# Default location of the on-disk isomorphism verdict cache shared by all scripts
+VERDICT_CACHE_FILE = 'isomorphism_verdict_cache.pkl'
+# Maximum number of verdicts kept, the least recently used ones are evicted first
+VERDICT_CACHE_SIZE = 1000000
+# Match semantics of node_match/edge_match used by all post-clustering scripts
+MATCH_SEMANTICS = CANONICAL_MATCH_SEMANTICS
+
+
+# Function to build the cache key of a pair of graph digests (the pair is unordered, isomorphism is symmetric)
+def verdict_key(digest1, digest2, match_semantics=MATCH_SEMANTICS):
+    return tuple(sorted((digest1, digest2))) + (match_semantics,)
+
+
+# Function to load the verdict cache from disk (empty cache if the file does not exist yet)
+def load_verdict_cache(filename=VERDICT_CACHE_FILE):
+    if not os.path.exists(filename):
+        return OrderedDict()
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+# Function to save the verdict cache to disk (trimmed to the most recently used verdicts)
+def save_verdict_cache(cache, filename=VERDICT_CACHE_FILE, max_size=VERDICT_CACHE_SIZE):
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+    # Write to a temporary file first so that an interrupted run never leaves a broken cache behind
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as f:
+        pickle.dump(cache, f)
+    os.replace(temp_filename, filename)
+
+
+# Function to compute the exact invariants that isomorphic reaction centers always share
+# (structure: node/edge counts and degree sequence, labels: element/charge multiset and edge order multiset)
+def exact_signature(graph):
+    structure = (graph.number_of_nodes(), graph.number_of_edges(), sorted(degree for _, degree in graph.degree()))
+    labels = (
+        Counter((attrs['element'], attrs['charge']) for _, attrs in graph.nodes(data=True)),
+        Counter(attrs['order'] for _, _, attrs in graph.edges(data=True)),
+    )
+    return structure, labels
+
+
+# Function to check whether two exact signatures rule out an isomorphism under the given match semantics
+# (the label multisets only hold for the default semantics, any other semantics only gets the structural checks)
+def signatures_differ(signature1, signature2, match_semantics=MATCH_SEMANTICS):
+    if match_semantics == CANONICAL_MATCH_SEMANTICS:
+        return signature1 != signature2
+    return signature1[0] != signature2[0]
+
+
+# Function to get the content digest and exact signature of a reaction center, computed once per index and run
+def graph_keys_of(data, idx, graph_keys):
+    if idx not in graph_keys:
+        graph = data[idx]['reaction_center']
+        graph_keys[idx] = (graph_content_digest(graph), exact_signature(graph))
+    return graph_keys[idx]
+
+
+# Function to test two reaction centers for isomorphism, consulting cheap exact checks and the verdict cache
+# before the matcher (graph_labels optionally holds comparable WL labels per index, in node order)
+def cached_is_isomorphic(data, idx1, idx2, graph_keys, verdict_cache, node_match, edge_match,
+                         match_semantics=MATCH_SEMANTICS, max_size=VERDICT_CACHE_SIZE, call_log=None,
+                         graph_labels=None):
+    digest1, signature1 = graph_keys_of(data, idx1, graph_keys)
+    digest2, signature2 = graph_keys_of(data, idx2, graph_keys)
+    # Equal digests mean equal node ids and labels, so the graphs are trivially isomorphic
+    if digest1 == digest2:
+        return True
+    # Graphs with different invariants are rejected without a matcher call and are not cached
+    if signatures_differ(signature1, signature2, match_semantics):
+        return False
+
+    key = verdict_key(digest1, digest2, match_semantics)
+    if key in verdict_cache:
+        verdict_cache.move_to_end(key)
+        return verdict_cache[key]
+
+    graph1, graph2 = data[idx1]['reaction_center'], data[idx2]['reaction_center']
+    node_colors = None
+    if graph_labels is not None:
+        node_colors = (dict(zip(graph1.nodes(), graph_labels[idx1])), dict(zip(graph2.nodes(), graph_labels[idx2])))
+    verdict = budgeted_is_isomorphic(graph1, graph2, node_match, edge_match, call_log, node_colors, match_semantics)
+    # Unresolved pairs count as not isomorphic for this run, but are tried again in the next one
+    if verdict is None:
+        return False
+    verdict_cache[key] = verdict
+    if len(verdict_cache) > max_size:
+        verdict_cache.popitem(last=False)
+    return verdict
+
+
+# Function to post-cluster by isomorphism with the verdict cache (shared by all post-clustering scripts)
+# (every graph is compared to the representatives of its group's sub-clusters, the most recently matched
+# sub-cluster first, graph_labels optionally restricts VF2 to nodes of equal WL label)
+def postcluster_by_isomorphism(data, clusters, verdict_cache, call_log, node_match, edge_match, graph_labels=None,
+                               match_semantics=MATCH_SEMANTICS):
+    final_clusters = []
+    graph_keys = {}
+    for group in clusters:
+        sub_clusters = []
+        # Sub-clusters ordered by their last hit, the most recently matched one is tried first
+        recent_sub_clusters = []
+        for idx in group:
+            is_added = False
+            for position, sub_cluster in enumerate(recent_sub_clusters):
+                if cached_is_isomorphic(data, idx, sub_cluster[0], graph_keys, verdict_cache, node_match, edge_match,
+                                        match_semantics, call_log=call_log, graph_labels=graph_labels):
+                    sub_cluster.append(idx)
+                    recent_sub_clusters.insert(0, recent_sub_clusters.pop(position))
+                    is_added = True
+                    break
+            if not is_added:
+                sub_clusters.append([idx])
+                recent_sub_clusters.insert(0, sub_clusters[-1])
+        final_clusters.extend(sub_clusters)
+    return final_clusters
@@ -2,6 +2,9 @@ import pickle
 import networkx as nx
 from networkx.algorithms.graph_hashing import weisfeiler_lehman_graph_hash
 import time
+from fingerprint_cache import fingerprint_key, load_fingerprint_cache, save_fingerprint_cache
+from verdict_cache import load_verdict_cache, postcluster_by_isomorphism, save_verdict_cache
+from isomorphism_budget import new_call_log, report_call_log
 
 # Load data
 with open('reaction_centers.pkl', 'rb') as f:
@@ -15,50 +18,38 @@ def edge_match(e1, e2):
     return e1['order'] == e2['order']
 
 
-# Function to prepare aggregated node attributes
+# Function to prepare aggregated node attributes on a separate label graph (the reaction center is not modified)
 def prepare_node_attributes(graph):
-    for node, attrs in graph.nodes(data=True):
-        # Combine 'charge' and 'element' into a single string attribute
-        attrs['aggregated'] = f"{attrs['element']}_{attrs['charge']}"
-
-# Function to calculate WL graph hash
-def calculate_wl_hash(graph):
-    # Ensure nodes have aggregated attributes
-    prepare_node_attributes(graph)
-    # Compute Weisfeiler-Lehman graph hash considering node and edge attributes
-    return weisfeiler_lehman_graph_hash(graph, node_attr='aggregated',edge_attr='order',iterations=3) #is order for edges the best option???
+    label_graph = nx.Graph()
+    # Combine 'charge' and 'element' into a single string attribute
+    label_graph.add_nodes_from(
+        (node, {'aggregated': f"{attrs['element']}_{attrs['charge']}"}) for node, attrs in graph.nodes(data=True)
+    )
+    label_graph.add_edges_from((u, v, {'order': attrs['order']}) for u, v, attrs in graph.edges(data=True))
+    return label_graph
+
+# Function to calculate WL graph hash (looked up in the fingerprint cache first)
+def calculate_wl_hash(graph, fingerprint_cache):
+    key = fingerprint_key(graph, node_attr='aggregated', edge_attr='order', iterations=3)
+    if key not in fingerprint_cache:
+        # Ensure nodes have aggregated attributes
+        label_graph = prepare_node_attributes(graph)
+        # Compute Weisfeiler-Lehman graph hash considering node and edge attributes
+        fingerprint_cache[key] = weisfeiler_lehman_graph_hash(label_graph, node_attr='aggregated',edge_attr='order',iterations=3) #is order for edges the best option???
+    return fingerprint_cache[key]
 
 # Function to cluster by WL graph hash
-def cluster_by_wl_hash(data):
+def cluster_by_wl_hash(data, fingerprint_cache):
     clusters = {}
     for i, rc in enumerate(data):
         # Calculate WL hash for the current graph
-        wl_hash = calculate_wl_hash(rc['reaction_center'])
+        wl_hash = calculate_wl_hash(rc['reaction_center'], fingerprint_cache)
         # Group by WL hash
         if wl_hash not in clusters:
             clusters[wl_hash] = []
         clusters[wl_hash].append(i)
     return list(clusters.values())
 
-# Function to post-cluster by isomorphism
-def postcluster_by_isomorphism(data, invariant_clusters):
-    final_clusters = []
-    for group in invariant_clusters:
-        sub_clusters = []
-        for idx in group:
-            rc = data[idx]['reaction_center']
-            is_added = False
-            for sub_cluster in sub_clusters:
-                representative_rc = data[sub_cluster[0]]['reaction_center']
-                if nx.is_isomorphic(rc, representative_rc, node_match=node_match, edge_match=edge_match):
-                    sub_cluster.append(idx)
-                    is_added = True
-                    break
-            if not is_added:
-                sub_clusters.append([idx])
-        final_clusters.extend(sub_clusters)
-    return final_clusters
-
 import matplotlib.pyplot as plt
 
 # Function to plot cluster size distribution
@@ -107,15 +98,24 @@ def visualize_top_clusters_representative_graphs(clusters, graphs, algorithm_nam
 
 # Main function to perform clustering
 def main():
+    # Reuse WL fingerprints computed by earlier runs
+    fingerprint_cache = load_fingerprint_cache()
+
     start_invariants = time.time()
-    clusters = cluster_by_wl_hash(data)
+    clusters = cluster_by_wl_hash(data, fingerprint_cache)
     print(f"Cluster durch Hash: {len(clusters)}")
     end_invariants = time.time()
 
+    save_fingerprint_cache(fingerprint_cache)
+
     # Step 2: Measure time for post-clustering by isomorphism
+    verdict_cache = load_verdict_cache()
+    call_log = new_call_log()
     start_isomorphism = time.time()
-    final_clusters = postcluster_by_isomorphism(data, clusters)
+    final_clusters = postcluster_by_isomorphism(data, clusters, verdict_cache, call_log, node_match, edge_match)
     end_isomorphism = time.time()
+    save_verdict_cache(verdict_cache)
+    report_call_log(call_log)
 
     # Total time
     total_time = (end_invariants - start_invariants) + (end_isomorphism - start_isomorphism)
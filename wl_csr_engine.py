@@ -0,0 +1,289 @@
+import pickle
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# Number of bits reserved for the edge order code when a (neighbor color, edge order) pair is packed into one integer
+EDGE_ORDER_BITS = 16
+
+
+# Function to look up (or assign) the dense integer code of a key in a compression table
+def compress_key(key, table):
+    if key not in table:
+        table[key] = len(table)
+    return table[key]
+
+
+# Function to convert a reaction center into integer CSR arrays
+def graph_to_csr(graph, node_label_table, edge_order_table):
+    node_index = {node: i for i, node in enumerate(graph.nodes())}
+    indptr = [0]
+    indices = []
+    edge_orders = []
+    node_labels = []
+    node_attrs = graph.nodes
+    for node, neighbors in graph.adjacency():
+        # Combine 'element' and 'charge' as the base label
+        attrs = node_attrs[node]
+        node_labels.append(compress_key((attrs['element'], attrs['charge']), node_label_table))
+        for neighbor, edge_attrs in neighbors.items():
+            indices.append(node_index[neighbor])
+            edge_orders.append(compress_key(edge_attrs['order'], edge_order_table))
+        indptr.append(len(indices))
+
+    indptr = np.array(indptr, dtype=np.int64)
+    return {
+        'indptr': indptr,
+        'indices': np.array(indices, dtype=np.int64),
+        'edge_orders': np.array(edge_orders, dtype=np.int64),
+        'node_labels': np.array(node_labels, dtype=np.int64),
+        # Row id of every entry in 'indices', needed to sort the neighbor lists segment by segment
+        'rows': np.repeat(np.arange(len(node_labels), dtype=np.int64), np.diff(indptr)),
+    }
+
+
+# Function to convert every reaction center of a dataset into CSR arrays with shared label tables
+def dataset_to_csr(data, node_label_table=None, edge_order_table=None):
+    node_label_table = {} if node_label_table is None else node_label_table
+    edge_order_table = {} if edge_order_table is None else edge_order_table
+    csr_graphs = [graph_to_csr(item['reaction_center'], node_label_table, edge_order_table) for item in data]
+    if len(edge_order_table) >= 1 << EDGE_ORDER_BITS:
+        raise ValueError(f"Too many distinct edge orders ({len(edge_order_table)}) for {EDGE_ORDER_BITS} bits")
+    return csr_graphs
+
+
+# Function to sort the values of every CSR row independently
+def sort_segments(values, rows):
+    return values[np.lexsort((values, rows))]
+
+
+# Function to compress one key per node (own code followed by the sorted neighbor codes of its row)
+def compress_rows(own_codes, sorted_codes, indptr, table):
+    own_codes = own_codes.tolist()
+    sorted_codes = sorted_codes.tolist()
+    indptr = indptr.tolist()
+    new_colors = [
+        compress_key((own_codes[i],) + tuple(sorted_codes[indptr[i]:indptr[i + 1]]), table)
+        for i in range(len(own_codes))
+    ]
+    return np.array(new_colors, dtype=np.int64)
+
+
+# Function to initialize node colors WITH edge labels (element/charge plus sorted incident edge orders)
+def initialize_colors_csr(csr, initial_hash_table):
+    sorted_orders = sort_segments(csr['edge_orders'], csr['rows'])
+    return compress_rows(csr['node_labels'], sorted_orders, csr['indptr'], initial_hash_table)
+
+
+# Function to perform a single Weisfeiler-Lehman iteration on CSR arrays using a shared hash table
+def wl_iteration_csr(csr, colors, shared_hash_table):
+    # Pack every (neighbor color, edge order) pair into one integer and sort it per node
+    neighbor_codes = (colors[csr['indices']] << EDGE_ORDER_BITS) | csr['edge_orders']
+    sorted_codes = sort_segments(neighbor_codes, csr['rows'])
+    return compress_rows(colors, sorted_codes, csr['indptr'], shared_hash_table)
+
+
+# Function to generate a hashable histogram of node colors
+def generate_histogram_csr(colors):
+    # The sorted color sequence is equal for two graphs exactly when their color histograms are equal
+    return tuple(np.sort(colors).tolist())
+
+
+# Function to perform WL clustering within a set of graphs
+def wl_clustering_csr(csr_graphs, colors, graph_indices, shared_hash_table):
+    clusters = defaultdict(list)
+    for graph_idx in graph_indices:
+        colors[graph_idx] = wl_iteration_csr(csr_graphs[graph_idx], colors[graph_idx], shared_hash_table)
+        clusters[generate_histogram_csr(colors[graph_idx])].append(graph_idx)
+    return clusters
+
+
+# Function to perform recursive WL clustering on CSR arrays
+def recursive_wl_clustering_csr(data, verbose=True):
+    csr_graphs = dataset_to_csr(data)
+
+    # Initial clustering by first WL iteration
+    initial_hash_table = {}
+    colors = [initialize_colors_csr(csr, initial_hash_table) for csr in csr_graphs]
+    clusters = wl_clustering_csr(csr_graphs, colors, range(len(csr_graphs)), {})
+
+    num_clusters = len(clusters)
+    iteration = 1
+    if verbose:
+        print(f"Iteration {iteration}: Number of clusters = {num_clusters}")
+
+    # Perform recursive WL clustering
+    while True:
+        new_clusters = defaultdict(list)
+        shared_hash_table = {}  # Reset shared hash table for each iteration
+
+        # Process each cluster independently
+        for cluster_graphs in clusters.values():
+            sub_clusters = wl_clustering_csr(csr_graphs, colors, cluster_graphs, shared_hash_table)
+            for sub_cluster_key, sub_cluster_graphs in sub_clusters.items():
+                new_clusters[sub_cluster_key].extend(sub_cluster_graphs)
+
+        iteration += 1
+        num_new_clusters = len(new_clusters)
+        if verbose:
+            print(f"Iteration {iteration}: Number of clusters = {num_new_clusters}")
+
+        # Check if the number of clusters has stabilized
+        if num_new_clusters == num_clusters:
+            break
+        num_clusters = num_new_clusters
+        clusters = new_clusters
+
+    return list(clusters.values())
+
+
+# Function to pack CSR graphs into one disjoint-union CSR graph
+def pack_disjoint_union(csr_graphs):
+    num_nodes = np.array([len(csr['node_labels']) for csr in csr_graphs], dtype=np.int64)
+    node_offsets = np.concatenate(([0], np.cumsum(num_nodes)))
+    num_entries = np.array([len(csr['indices']) for csr in csr_graphs], dtype=np.int64)
+    entry_offsets = np.concatenate(([0], np.cumsum(num_entries)))
+
+    return {
+        'indptr': np.concatenate([csr['indptr'][:-1] + offset for csr, offset in zip(csr_graphs, entry_offsets)]
+                                 + [entry_offsets[-1:]]),
+        'indices': np.concatenate([csr['indices'] + offset for csr, offset in zip(csr_graphs, node_offsets)]
+                                  + [np.zeros(0, dtype=np.int64)]),
+        'edge_orders': np.concatenate([csr['edge_orders'] for csr in csr_graphs] + [np.zeros(0, dtype=np.int64)]),
+        'node_labels': np.concatenate([csr['node_labels'] for csr in csr_graphs] + [np.zeros(0, dtype=np.int64)]),
+        'rows': np.concatenate([csr['rows'] + offset for csr, offset in zip(csr_graphs, node_offsets)]
+                               + [np.zeros(0, dtype=np.int64)]),
+        # Graph id of every node and node offset of every graph
+        'node_graph': np.repeat(np.arange(len(csr_graphs), dtype=np.int64), num_nodes),
+        'graph_ptr': node_offsets,
+    }
+
+
+# Function to assign dense ids to the distinct rows of an integer matrix (equal rows get equal ids)
+def dense_row_ids(matrix):
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort(matrix.T[::-1])
+    sorted_matrix = matrix[order]
+    starts_new_row = np.empty(len(matrix), dtype=bool)
+    starts_new_row[0] = True
+    starts_new_row[1:] = np.any(sorted_matrix[1:] != sorted_matrix[:-1], axis=1)
+    row_ids = np.empty(len(matrix), dtype=np.int64)
+    row_ids[order] = np.cumsum(starts_new_row) - 1
+    return row_ids
+
+
+# Function to compress all node keys of the disjoint union at once via padded rows and np.unique
+def compress_rows_vectorized(own_codes, sorted_codes, union):
+    indptr = union['indptr']
+    rows = union['rows']
+    degrees = np.diff(indptr)
+    max_degree = int(degrees.max()) if len(degrees) else 0
+
+    keys = np.full((len(own_codes), 1 + max_degree), -1, dtype=np.int64)
+    keys[:, 0] = own_codes
+    keys[rows, 1 + np.arange(len(rows)) - indptr[rows]] = sorted_codes
+    return dense_row_ids(keys)
+
+
+# Function to initialize the node colors of the disjoint union
+def initialize_colors_union(union):
+    sorted_orders = sort_segments(union['edge_orders'], union['rows'])
+    return compress_rows_vectorized(union['node_labels'], sorted_orders, union)
+
+
+# Function to perform a single Weisfeiler-Lehman iteration on all graphs of the disjoint union
+def wl_iteration_union(union, colors):
+    neighbor_codes = (colors[union['indices']] << EDGE_ORDER_BITS) | union['edge_orders']
+    sorted_codes = sort_segments(neighbor_codes, union['rows'])
+    return compress_rows_vectorized(colors, sorted_codes, union)
+
+
+# Function to compute a histogram class per graph with a segmented reduction over (graph, color) pairs
+def histogram_classes_union(union, colors):
+    num_graphs = len(union['graph_ptr']) - 1
+    num_colors = int(colors.max()) + 1 if len(colors) else 1
+
+    # Count every (graph, color) pair; the result is sorted by graph, then by color
+    pair_keys, counts = np.unique(union['node_graph'] * num_colors + colors, return_counts=True)
+    pair_graphs = pair_keys // num_colors
+    distinct_per_graph = np.bincount(pair_graphs, minlength=num_graphs)
+    segment_starts = np.concatenate(([0], np.cumsum(distinct_per_graph)))
+    positions = np.arange(len(pair_keys)) - segment_starts[pair_graphs]
+
+    # One padded (color, count, color, count, ...) row per graph
+    max_distinct = int(distinct_per_graph.max()) if num_graphs else 0
+    histograms = np.full((num_graphs, 2 * max_distinct + 1), -1, dtype=np.int64)
+    histograms[pair_graphs, 2 * positions] = pair_keys % num_colors
+    histograms[pair_graphs, 2 * positions + 1] = counts
+    return dense_row_ids(histograms)
+
+
+# Function to rank clusters like the sequential run: by parent cluster rank, then by first member
+def rank_clusters(classes, parent_ranks):
+    _, first_members = np.unique(classes, return_index=True)
+    order = np.lexsort((first_members, parent_ranks[first_members]))
+    class_ranks = np.empty(len(first_members), dtype=np.int64)
+    class_ranks[order] = np.arange(len(first_members))
+    return class_ranks[classes]
+
+
+# Function to turn per-graph cluster ranks into a list of clusters
+def clusters_from_ranks(graph_ranks):
+    order = np.argsort(graph_ranks, kind='stable')
+    boundaries = np.flatnonzero(np.diff(graph_ranks[order])) + 1
+    return [cluster.tolist() for cluster in np.split(order, boundaries)] if len(order) else []
+
+
+# Function to perform recursive WL clustering on the whole dataset in one disjoint union
+def recursive_wl_clustering_union(data, verbose=True):
+    union = pack_disjoint_union(dataset_to_csr(data))
+    num_graphs = len(data)
+
+    # Initial clustering by first WL iteration
+    colors = wl_iteration_union(union, initialize_colors_union(union))
+    graph_ranks = rank_clusters(histogram_classes_union(union, colors), np.zeros(num_graphs, dtype=np.int64))
+
+    num_clusters = int(graph_ranks.max()) + 1 if num_graphs else 0
+    iteration = 1
+    if verbose:
+        print(f"Iteration {iteration}: Number of clusters = {num_clusters}")
+
+    # Perform recursive WL clustering
+    while True:
+        colors = wl_iteration_union(union, colors)
+        new_graph_ranks = rank_clusters(histogram_classes_union(union, colors), graph_ranks)
+
+        iteration += 1
+        num_new_clusters = int(new_graph_ranks.max()) + 1 if num_graphs else 0
+        if verbose:
+            print(f"Iteration {iteration}: Number of clusters = {num_new_clusters}")
+
+        # Check if the number of clusters has stabilized
+        if num_new_clusters == num_clusters:
+            break
+        num_clusters = num_new_clusters
+        graph_ranks = new_graph_ranks
+
+    return clusters_from_ranks(graph_ranks)
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Larger_rcs.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    # Refine every reaction center at once in one disjoint union (False: graph by graph)
+    use_disjoint_union = True
+
+    wl_start = time.time()
+    if use_disjoint_union:
+        final_clusters = recursive_wl_clustering_union(data)
+    else:
+        final_clusters = recursive_wl_clustering_csr(data)
+    wl_end = time.time()
+
+    print(f"Time for CSR WL-Implementation: {wl_end - wl_start:.2f}s")
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")
@@ -0,0 +1,141 @@
+import hashlib
+import pickle
+import time
+
+import numpy as np
+
+from wl_csr_engine import clusters_from_ranks, dataset_to_csr, dense_row_ids, pack_disjoint_union, rank_clusters
+
+# Seed used when no other seed is given; runs with the same seed always produce the same fingerprints
+DEFAULT_SEED = 0
+
+# Odd 64-bit constants of the splitmix64 finalizer
+MIX_CONSTANT_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_CONSTANT_2 = np.uint64(0x94D049BB133111EB)
+
+
+# Function to hash a string to an unsigned 64-bit integer that is stable across processes and runs
+def stable_hash64(text, seed=DEFAULT_SEED):
+    digest = hashlib.blake2b(text.encode(), digest_size=8, key=seed.to_bytes(8, 'little', signed=True))
+    return int.from_bytes(digest.digest(), 'little')
+
+
+# Function to scramble an array of unsigned 64-bit integers (splitmix64 finalizer, wraps around on overflow)
+def mix64(values):
+    values = (values ^ (values >> np.uint64(30))) * MIX_CONSTANT_1
+    values = (values ^ (values >> np.uint64(27))) * MIX_CONSTANT_2
+    return values ^ (values >> np.uint64(31))
+
+
+# Function to sum the values of every CSR segment modulo 2^64 (order independent, so no sorting is needed)
+def segment_sums(values, indptr):
+    cumulative = np.concatenate(([np.uint64(0)], np.cumsum(values, dtype=np.uint64)))
+    return cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+
+
+# Function to give an edge order a textual form that does not depend on int/float representation
+def edge_order_text(order):
+    if isinstance(order, (tuple, list)):
+        return repr(tuple(float(value) for value in order))
+    return repr(float(order))
+
+
+# Function to pack a dataset into a disjoint union together with content-based 64-bit label hashes
+def hashed_disjoint_union(data, seed=DEFAULT_SEED):
+    node_label_table = {}
+    edge_order_table = {}
+    union = pack_disjoint_union(dataset_to_csr(data, node_label_table, edge_order_table))
+
+    # The hashes depend on the label values only, never on the order in which the tables were filled
+    label_hashes = np.array([stable_hash64(f"{element}_{charge}", seed) for element, charge in node_label_table],
+                            dtype=np.uint64)
+    order_hashes = np.array([stable_hash64(edge_order_text(order), seed) for order in edge_order_table],
+                            dtype=np.uint64)
+    union['node_hashes'] = label_hashes[union['node_labels']] if len(label_hashes) else np.zeros(0, dtype=np.uint64)
+    union['edge_hashes'] = order_hashes[union['edge_orders']] if len(order_hashes) else np.zeros(0, dtype=np.uint64)
+    union['seed_hash'] = np.uint64(stable_hash64('weisfeiler-lehman', seed))
+    return union
+
+
+# Function to initialize the node hashes WITH edge labels (element/charge plus the multiset of incident edge orders)
+def initialize_hashes(union):
+    incident_orders = segment_sums(mix64(union['edge_hashes'] ^ union['seed_hash']), union['indptr'])
+    return mix64(mix64(union['node_hashes']) + incident_orders)
+
+
+# Function to perform a single Weisfeiler-Lehman iteration on 64-bit node hashes
+def wl_iteration_hashed(union, hashes):
+    # Every (neighbor hash, edge order) pair is scrambled on its own and the pairs are summed per node
+    neighbor_pairs = mix64(hashes[union['indices']] + mix64(union['edge_hashes'] ^ union['seed_hash']))
+    return mix64(mix64(hashes ^ union['seed_hash']) + segment_sums(neighbor_pairs, union['indptr']))
+
+
+# Function to compute the 64-bit fingerprint of every graph from the multiset of its node hashes
+def graph_fingerprints(union, hashes):
+    node_sums = segment_sums(mix64(hashes), union['graph_ptr'])
+    num_nodes = np.diff(union['graph_ptr']).astype(np.uint64)
+    return mix64(node_sums + mix64(num_nodes ^ union['seed_hash']))
+
+
+# Function to compute deterministic WL fingerprints for all reaction centers
+def wl_fingerprints(data, iterations=3, seed=DEFAULT_SEED):
+    union = hashed_disjoint_union(data, seed)
+    hashes = initialize_hashes(union)
+    for _ in range(iterations):
+        hashes = wl_iteration_hashed(union, hashes)
+    return graph_fingerprints(union, hashes)
+
+
+# Function to perform recursive WL clustering with deterministic 64-bit hashes instead of a shared hash table
+def recursive_wl_clustering_hashed(data, seed=DEFAULT_SEED, verbose=True):
+    union = hashed_disjoint_union(data, seed)
+    num_graphs = len(data)
+
+    # Initial clustering by first WL iteration
+    hashes = wl_iteration_hashed(union, initialize_hashes(union))
+    classes = np.unique(graph_fingerprints(union, hashes), return_inverse=True)[1].reshape(-1)
+    graph_ranks = rank_clusters(classes, np.zeros(num_graphs, dtype=np.int64))
+
+    num_clusters = int(graph_ranks.max()) + 1 if num_graphs else 0
+    iteration = 1
+    if verbose:
+        print(f"Iteration {iteration}: Number of clusters = {num_clusters}")
+
+    # Perform recursive WL clustering
+    while True:
+        hashes = wl_iteration_hashed(union, hashes)
+        # Fingerprints of one round are refined by the previous clusters, as the histograms are in the other engines
+        classes = dense_row_ids(np.stack((graph_ranks.astype(np.uint64), graph_fingerprints(union, hashes)), axis=1))
+        new_graph_ranks = rank_clusters(classes, graph_ranks)
+
+        iteration += 1
+        num_new_clusters = int(new_graph_ranks.max()) + 1 if num_graphs else 0
+        if verbose:
+            print(f"Iteration {iteration}: Number of clusters = {num_new_clusters}")
+
+        # Check if the number of clusters has stabilized
+        if num_new_clusters == num_clusters:
+            break
+        num_clusters = num_new_clusters
+        graph_ranks = new_graph_ranks
+
+    return clusters_from_ranks(graph_ranks)
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Larger_rcs.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    start = time.time()
+    fingerprints = wl_fingerprints(data, iterations=3)
+    end = time.time()
+    print(f"Time for deterministic WL fingerprints: {end - start:.2f}s")
+    print(f"Distinct fingerprints: {len(np.unique(fingerprints))}")
+
+    wl_start = time.time()
+    final_clusters = recursive_wl_clustering_hashed(data)
+    wl_end = time.time()
+    print(f"Time for hashed WL-Implementation: {wl_end - wl_start:.2f}s")
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")
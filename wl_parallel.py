@@ -0,0 +1,133 @@
+import os
+import pickle
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from wl_csr_engine import clusters_from_ranks, dense_row_ids, rank_clusters
+from wl_hashing import (DEFAULT_SEED, graph_fingerprints, hashed_disjoint_union, initialize_hashes,
+                        wl_iteration_hashed)
+
+
+# Reaction centers of the dataset, set once per worker process by the pool initializer
+# (with the fork start method they are inherited, so the graphs are never pickled)
+_worker_data = None
+
+
+# Function to hand the reaction centers to a worker process
+def init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+# Function to count the distinct node hashes of every graph of a disjoint union
+def distinct_hashes_per_graph(union, hashes):
+    order = np.lexsort((hashes, union['node_graph']))
+    graphs, sorted_hashes = union['node_graph'][order], hashes[order]
+    starts_new = np.ones(len(order), dtype=bool)
+    starts_new[1:] = (graphs[1:] != graphs[:-1]) | (sorted_hashes[1:] != sorted_hashes[:-1])
+    return np.bincount(graphs[starts_new], minlength=len(union['graph_ptr']) - 1)
+
+
+# Function to compute the WL fingerprints of one shard in a worker, one column per round until all its graphs are stable
+# (the hashes depend only on the graph content, so shards need no shared table and no merge afterwards;
+# once a graph's partition stopped refining its later fingerprints carry no information and are set to 0)
+def fingerprint_shard(task):
+    start, end, seed = task
+    shard = _worker_data[start:end]
+    union = hashed_disjoint_union(shard, seed)
+    hashes = initialize_hashes(union)
+    num_hashes = distinct_hashes_per_graph(union, hashes)
+    stable = np.zeros(len(shard), dtype=bool)
+    columns = []
+    while True:
+        hashes = wl_iteration_hashed(union, hashes)
+        fingerprints = graph_fingerprints(union, hashes)
+        fingerprints[stable] = 0
+        columns.append(fingerprints)
+        new_num_hashes = distinct_hashes_per_graph(union, hashes)
+        stable |= new_num_hashes == num_hashes
+        num_hashes = new_num_hashes
+        if stable.all():
+            return np.stack(columns, axis=1)
+
+
+# Function to split the graphs into contiguous shards with roughly equal numbers of nodes
+def split_shards(graph_ptr, num_shards):
+    num_graphs = len(graph_ptr) - 1
+    targets = np.linspace(0, graph_ptr[-1], num_shards + 1)[1:-1]
+    boundaries = np.unique(np.concatenate(([0], np.searchsorted(graph_ptr, targets), [num_graphs])))
+    return [(int(start), int(end)) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+
+# Function to collect the per-round fingerprints of all graphs from the shards (rounds a shard did not need are 0)
+def parallel_fingerprints(data, processes, shards_per_process, seed):
+    num_nodes = np.array([item['reaction_center'].number_of_nodes() for item in data], dtype=np.int64)
+    graph_ptr = np.concatenate(([0], np.cumsum(num_nodes)))
+    shards = split_shards(graph_ptr, processes * shards_per_process)
+    tasks = [(start, end, seed) for start, end in shards]
+    with Pool(processes, initializer=init_worker, initargs=(data,)) as pool:
+        shard_columns = pool.map(fingerprint_shard, tasks)
+
+    num_rounds = max((columns.shape[1] for columns in shard_columns), default=0)
+    fingerprints = np.zeros((len(data), num_rounds), dtype=np.uint64)
+    for (start, end), columns in zip(shards, shard_columns):
+        fingerprints[start:end, :columns.shape[1]] = columns
+    return fingerprints
+
+
+# Function to perform recursive WL clustering with the refinement spread over a process pool
+# (same clusters in the same order as recursive_wl_clustering_hashed)
+def recursive_wl_clustering_parallel(data, processes=None, shards_per_process=4, seed=DEFAULT_SEED, verbose=True):
+    num_graphs = len(data)
+    if not num_graphs:
+        return []
+    fingerprints = parallel_fingerprints(data, processes or os.cpu_count(), shards_per_process, seed)
+
+    # Fingerprints of later rounds than any shard needed are all 0 and cannot split a cluster any more
+    def fingerprint_round(round_idx):
+        if round_idx < fingerprints.shape[1]:
+            return fingerprints[:, round_idx]
+        return np.zeros(num_graphs, dtype=np.uint64)
+
+    # Initial clustering by first WL iteration
+    classes = np.unique(fingerprint_round(0), return_inverse=True)[1].reshape(-1)
+    graph_ranks = rank_clusters(classes, np.zeros(num_graphs, dtype=np.int64))
+
+    num_clusters = int(graph_ranks.max()) + 1
+    iteration = 1
+    if verbose:
+        print(f"Iteration {iteration}: Number of clusters = {num_clusters}")
+
+    # Perform recursive WL clustering
+    while True:
+        classes = dense_row_ids(np.stack((graph_ranks.astype(np.uint64), fingerprint_round(iteration)), axis=1))
+        new_graph_ranks = rank_clusters(classes, graph_ranks)
+
+        iteration += 1
+        num_new_clusters = int(new_graph_ranks.max()) + 1
+        if verbose:
+            print(f"Iteration {iteration}: Number of clusters = {num_new_clusters}")
+
+        # Check if the number of clusters has stabilized
+        if num_new_clusters == num_clusters:
+            break
+        num_clusters = num_new_clusters
+        graph_ranks = new_graph_ranks
+
+    return clusters_from_ranks(graph_ranks)
+
+
+# Main function
+if __name__ == "__main__":
+    # Load data
+    with open('Larger_rcs.pkl', 'rb') as f:
+        data = pickle.load(f)
+
+    for processes in sorted({1, 2, 4, os.cpu_count()}):
+        wl_start = time.time()
+        final_clusters = recursive_wl_clustering_parallel(data, processes=processes, verbose=False)
+        wl_end = time.time()
+        print(f"Time for parallel WL-Implementation with {processes} processes: {wl_end - wl_start:.2f}s")
+    print(f"Final number of clusters after WL Test: {len(final_clusters)}")